@@ -13,9 +13,18 @@ config = context.config
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
-if config.config_file_name is not None:
+# При вызове из приложения (src/startup.py) его логирование не меняется
+if (
+        config.config_file_name is not None
+        and "connection" not in config.attributes
+):
     fileConfig(config.config_file_name)
 
+# адрес БД - из настроек приложения (переменные окружения POSTGRES_*)
+from src.database import DATABASE_URL
+
+config.set_main_option("sqlalchemy.url", DATABASE_URL.replace("%", "%%"))
+
 # add your model's MetaData object here
 # for 'autogenerate' support
 # from myapp import mymodel
@@ -83,6 +92,12 @@ async def run_async_migrations() -> None:
 def run_migrations_online() -> None:
     """Run migrations in 'online' mode."""
 
+    # соединение передано приложением (src/startup.py)
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        do_run_migrations(connection)
+        return
+
     asyncio.run(run_async_migrations())
 
 
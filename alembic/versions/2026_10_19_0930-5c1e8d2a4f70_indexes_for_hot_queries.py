@@ -0,0 +1,50 @@
+"""indexes for hot queries
+
+Revision ID: 5c1e8d2a4f70
+Revises: 1b92f11345f5
+Create Date: 2026-10-19 09:30:12.418305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1e8d2a4f70'
+down_revision: Union[str, None] = '1b92f11345f5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+INDEXES = (
+    ('ix_users_apy_key_user', 'users', ['apy_key_user']),
+    ('ix_tweets_user_id', 'tweets', ['user_id']),
+    ('ix_likes_tweet_tweet_id', 'likes_tweet', ['tweet_id']),
+    ('ix_followers_following_id', 'followers', ['following_id']),
+)
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=False,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in INDEXES:
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
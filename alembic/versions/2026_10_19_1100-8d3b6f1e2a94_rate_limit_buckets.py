@@ -0,0 +1,31 @@
+"""rate limit buckets
+
+Revision ID: 8d3b6f1e2a94
+Revises: 5c1e8d2a4f70
+Create Date: 2026-10-19 11:00:41.207733
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d3b6f1e2a94'
+down_revision: Union[str, None] = '5c1e8d2a4f70'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'rate_limit_buckets',
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('tat', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('key'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('rate_limit_buckets')
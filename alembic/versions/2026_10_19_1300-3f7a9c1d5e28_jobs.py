@@ -0,0 +1,68 @@
+"""jobs
+
+Revision ID: 3f7a9c1d5e28
+Revises: 8d3b6f1e2a94
+Create Date: 2026-10-19 13:00:12.584106
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f7a9c1d5e28'
+down_revision: Union[str, None] = '8d3b6f1e2a94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'jobs',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column(
+            'payload', postgresql.JSONB(astext_type=sa.Text()), nullable=False
+        ),
+        sa.Column(
+            'status', sa.String(), server_default='queued', nullable=False
+        ),
+        sa.Column(
+            'attempts', sa.Integer(), server_default='0', nullable=False
+        ),
+        sa.Column('max_attempts', sa.Integer(), nullable=False),
+        sa.Column(
+            'run_at',
+            sa.DateTime(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=False,
+        ),
+        sa.Column('locked_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_error', sa.String(), nullable=True),
+        sa.Column(
+            'created_at',
+            sa.DateTime(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_jobs_queued_run_at',
+        'jobs',
+        ['run_at'],
+        unique=False,
+        postgresql_where=sa.text("status = 'queued'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        'ix_jobs_queued_run_at',
+        table_name='jobs',
+        postgresql_where=sa.text("status = 'queued'"),
+    )
+    op.drop_table('jobs')
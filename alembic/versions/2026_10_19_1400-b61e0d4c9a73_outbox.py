@@ -0,0 +1,51 @@
+"""outbox
+
+Revision ID: b61e0d4c9a73
+Revises: 3f7a9c1d5e28
+Create Date: 2026-10-19 14:00:37.902415
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b61e0d4c9a73'
+down_revision: Union[str, None] = '3f7a9c1d5e28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'outbox',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column(
+            'txid',
+            sa.BigInteger(),
+            server_default=sa.text('txid_current()'),
+            nullable=False,
+        ),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column(
+            'payload', postgresql.JSONB(astext_type=sa.Text()), nullable=False
+        ),
+        sa.Column(
+            'created_at',
+            sa.DateTime(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_outbox_txid_id', 'outbox', ['txid', 'id'], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_outbox_txid_id', table_name='outbox')
+    op.drop_table('outbox')
@@ -0,0 +1,61 @@
+"""notifications
+
+Revision ID: e42a7b8c1f06
+Revises: b61e0d4c9a73
+Create Date: 2026-10-19 15:00:21.117390
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e42a7b8c1f06'
+down_revision: Union[str, None] = 'b61e0d4c9a73'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'notifications',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('tweet_id', sa.Integer(), nullable=True),
+        sa.Column('bucket', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column(
+            'actor_ids', postgresql.ARRAY(sa.Integer()), nullable=False
+        ),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(
+            ['tweet_id'], ['tweets.id'], ondelete='CASCADE'
+        ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'uq_notifications_bucket',
+        'notifications',
+        ['user_id', 'kind', 'tweet_id', 'bucket'],
+        unique=True,
+        postgresql_nulls_not_distinct=True,
+    )
+    op.create_index(
+        'ix_notifications_user_updated',
+        'notifications',
+        ['user_id', sa.text('updated_at DESC'), sa.text('id DESC')],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        'ix_notifications_user_updated', table_name='notifications'
+    )
+    op.drop_index('uq_notifications_bucket', table_name='notifications')
+    op.drop_table('notifications')
@@ -0,0 +1,180 @@
+"""
+Сравнение чтения ленты и профиля через ORM и через строки Core.
+
+Запуск (БД из настроек Setting):
+    python -m bench.read_paths --tweets 500 --iterations 50
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+from typing import Awaitable, Callable, Dict, List
+
+from sqlalchemy import desc, func, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+
+from src import models, schemas
+from src.database import LocalAsyncSession, engine
+from src.utils import (
+    API_KEY_DEFAULT,
+    add_data_to_db,
+    get_user_id,
+    out_tweets_user,
+)
+
+
+async def orm_tweets_user(session: AsyncSession) -> List[schemas.Tweet]:
+    """Прежняя реализация ленты на ORM-объектах"""
+    stmt = (
+        select(models.Tweet)
+        .options(
+            joinedload(models.Tweet.user),
+            selectinload(models.Tweet.like_user),
+        )
+        .order_by(desc(models.Tweet.like_count))
+    )
+    query = await session.execute(stmt)
+    me_tweets: List[schemas.Tweet] = list()
+    for i_res in query.scalars().all():
+        attachments: List[str] = list()
+        for i_id in i_res.tweet_media_ids:
+            media = await session.get(models.TweetMedia, i_id)
+            if media:
+                attachments.append(media.name_file)
+        me_tweets.append(
+            schemas.Tweet(
+                id=i_res.id,
+                content=i_res.tweet_data,
+                attachments=attachments,
+                author=schemas.User(id=i_res.user.id, name=i_res.user.name),
+                likes=[
+                    schemas.Like(user_id=i_like.id, name=i_like.name)
+                    for i_like in i_res.like_user
+                ],
+            )
+        )
+    return me_tweets
+
+
+async def orm_user_id(session: AsyncSession) -> schemas.UserAll:
+    """Прежняя реализация профиля на ORM-объектах"""
+    user = await session.get(models.User, 1)
+    following = (await session.execute(user.following)).scalars().all()
+    followers = (await session.execute(user.followers)).scalars().all()
+    return schemas.UserAll(
+        id=user.id,
+        name=user.name,
+        following=[schemas.User(id=i.id, name=i.name) for i in following],
+        followers=[schemas.User(id=i.id, name=i.name) for i in followers],
+    )
+
+
+async def core_tweets_user(session: AsyncSession) -> None:
+    await out_tweets_user(session, API_KEY_DEFAULT)
+
+
+async def core_user_id(session: AsyncSession) -> None:
+    await get_user_id(session, 1)
+
+
+async def seed(count_tweets: int) -> None:
+    """Дополняет БД твитами с лайками до нужного количества"""
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+    async with LocalAsyncSession() as session:
+        await add_data_to_db(session)
+        query = await session.execute(select(func.count(models.Tweet.id)))
+        missing: int = count_tweets - query.scalar_one()
+        if missing <= 0:
+            return
+        users = (await session.execute(select(models.User.id))).scalars()
+        id_users: List[int] = list(users)
+        await session.execute(
+            insert(models.Tweet),
+            [
+                {
+                    "tweet_data": f"bench tweet {i}",
+                    "tweet_media_ids": [],
+                    "user_id": id_users[i % len(id_users)],
+                }
+                for i in range(missing)
+            ],
+        )
+        tweets = (await session.execute(select(models.Tweet.id))).scalars()
+        await session.execute(
+            pg_insert(models.LikesTweet).on_conflict_do_nothing(),
+            [
+                {"user_id": i_user, "tweet_id": i_tweet}
+                for i_tweet in tweets
+                for i_user in id_users
+                if i_tweet % (i_user + 1) == 0
+            ],
+        )
+        await session.commit()
+
+
+async def measure(
+        func_read: Callable[[AsyncSession], Awaitable[object]],
+        iterations: int,
+) -> Dict[str, float]:
+    """
+    Замеряет процессорное время и выделения памяти на один запрос
+    :return: Dict[str, float]
+        cpu_ms, wall_ms и пик выделенной памяти alloc_peak_kb на запрос
+    """
+    async with LocalAsyncSession() as session:
+        await func_read(session)  # прогрев кэша компиляции
+    cpu: float = 0.0
+    wall: float = 0.0
+    for _ in range(iterations):
+        async with LocalAsyncSession() as session:
+            start_cpu: float = time.process_time()
+            start_wall: float = time.perf_counter()
+            await func_read(session)
+            cpu += time.process_time() - start_cpu
+            wall += time.perf_counter() - start_wall
+
+    # отдельный проход: трассировка памяти искажает время
+    alloc_peak: int = 0
+    for _ in range(iterations):
+        async with LocalAsyncSession() as session:
+            tracemalloc.start()
+            await func_read(session)
+            alloc_peak += tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return {
+        "cpu_ms": cpu * 1000 / iterations,
+        "wall_ms": wall * 1000 / iterations,
+        "alloc_peak_kb": alloc_peak / 1024 / iterations,
+    }
+
+
+async def main(count_tweets: int, iterations: int) -> None:
+    await seed(count_tweets)
+    cases = (
+        ("feed", orm_tweets_user, core_tweets_user),
+        ("profile", orm_user_id, core_user_id),
+    )
+    for name, orm_func, core_func in cases:
+        orm = await measure(orm_func, iterations)
+        core = await measure(core_func, iterations)
+        print(f"{name}:")
+        for key in orm:
+            change: float = (
+                (core[key] - orm[key]) / orm[key] * 100 if orm[key] else 0.0
+            )
+            print(
+                f"  {key:>12}: orm {orm[key]:10.2f}  "
+                f"core {core[key]:10.2f}  ({change:+.1f}%)"
+            )
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tweets", type=int, default=500)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.tweets, args.iterations))
@@ -0,0 +1,307 @@
+"""
+Нагрузочные сценарии для API.
+
+Сценарий (bench/scenarios/*.json) - последовательность шагов, которая
+выполняется requests раз в concurrency параллельных потоков. В путях и
+заголовках подставляются случайные значения {api_key}, {user_id} и
+{tweet_id} из диапазонов --users и --tweets (или "variables" сценария).
+
+Запуск внутри процесса (ASGI-приложение src.main:app, БД из настроек,
+ограничение частоты запросов выключено):
+    python -m bench.run feed_reads profile_reads
+по сети, на работающий сервер:
+    python -m bench.run feed_reads --url http://localhost:8000
+сравнение с сохраненным результатом:
+    python -m bench.run feed_reads --baseline bench/results/baseline.json
+
+Задержки и rps считаются только по успешным ответам (2xx и 304),
+остальные учитываются в errors, ответы 429 - в throttled.
+
+Результаты сохраняются в bench/results/<время>.json.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from src.utils import API_KEY_DEFAULT
+
+PATH_BENCH: str = os.path.dirname(os.path.abspath(__file__))
+PATH_PROJECT: str = os.path.dirname(PATH_BENCH)
+PATH_SCENARIOS: str = os.path.join(PATH_BENCH, "scenarios")
+PATH_RESULTS: str = os.path.join(PATH_BENCH, "results")
+
+
+def load_scenario(name: str) -> Dict[str, Any]:
+    path: str = name if name.endswith(".json") else os.path.join(
+        PATH_SCENARIOS, f"{name}.json"
+    )
+    with open(path) as f:
+        scenario: Dict[str, Any] = json.load(f)
+    scenario["name"] = os.path.splitext(os.path.basename(path))[0]
+    return scenario
+
+
+def percentile(values: List[float], rank: float) -> float:
+    """Перцентиль по отсортированному списку (метод ближайшего ранга)"""
+    if not values:
+        return 0.0
+    index: int = max(0, min(len(values) - 1, round(rank * len(values)) - 1))
+    return values[index]
+
+
+def summary(
+        latencies: List[float], errors: int, throttled: int, elapsed: float
+) -> Dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies) + errors + throttled,
+        "errors": errors,
+        "throttled": throttled,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+class Variables:
+    """Случайные значения для подстановки в шаги сценария"""
+
+    def __init__(self, ranges: Dict[str, Tuple[int, int]], seed: int):
+        self.ranges: Dict[str, Tuple[int, int]] = ranges
+        self.rng: random.Random = random.Random(seed)
+
+    def sample(self) -> Dict[str, str]:
+        values: Dict[str, str] = {
+            name: str(self.rng.randint(low, high))
+            for name, (low, high) in self.ranges.items()
+        }
+        id_user: int = self.rng.randint(*self.ranges["user_id"])
+        values["api_key"] = (
+            API_KEY_DEFAULT
+            if id_user == 1
+            else f"{API_KEY_DEFAULT}{id_user - 1}"
+        )
+        return values
+
+
+async def run_scenario(
+        client: httpx.AsyncClient,
+        scenario: Dict[str, Any],
+        variables: Variables,
+) -> Dict[str, Any]:
+    """
+    Выполняет сценарий и возвращает сводку по нему и по каждому шагу
+    """
+    steps: List[Dict[str, Any]] = scenario["steps"]
+    step_names: List[str] = [
+        f"{step['method']} {step['path']}" for step in steps
+    ]
+    # задержки успешных ответов
+    latencies: Dict[str, List[float]] = {name: list() for name in step_names}
+    # ошибки - ответы кроме 2xx и 304 (без 429) и сбои соединения
+    errors: Dict[str, int] = {name: 0 for name in step_names}
+    # ответы 429 ограничения частоты считаются отдельно
+    throttled: Dict[str, int] = {name: 0 for name in step_names}
+    remaining: List[int] = [scenario["requests"]]
+    files: Dict[str, bytes] = dict()
+    for step in steps:
+        if "file" in step:
+            with open(os.path.join(PATH_PROJECT, step["file"]), "rb") as f:
+                files[step["file"]] = f.read()
+
+    async def worker() -> None:
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            values: Dict[str, str] = variables.sample()
+            for step, name in zip(steps, step_names):
+                upload: Optional[Dict[str, Any]] = None
+                if "file" in step:
+                    upload = {
+                        "file": (
+                            os.path.basename(step["file"]),
+                            files[step["file"]],
+                        )
+                    }
+                start: float = time.perf_counter()
+                try:
+                    response: httpx.Response = await client.request(
+                        step["method"],
+                        step["path"].format(**values),
+                        headers={
+                            key: value.format(**values)
+                            for key, value in step.get("headers", {}).items()
+                        },
+                        files=upload,
+                    )
+                    status: int = response.status_code
+                except httpx.HTTPError:
+                    status = 0
+                if status == 429:
+                    throttled[name] += 1
+                elif 200 <= status < 300 or status == 304:
+                    latencies[name].append(time.perf_counter() - start)
+                else:
+                    errors[name] += 1
+
+    start: float = time.perf_counter()
+    await asyncio.gather(
+        *(worker() for _ in range(scenario["concurrency"]))
+    )
+    elapsed: float = time.perf_counter() - start
+
+    all_latencies: List[float] = [
+        value for values in latencies.values() for value in values
+    ]
+    return {
+        **summary(
+            all_latencies,
+            sum(errors.values()),
+            sum(throttled.values()),
+            elapsed,
+        ),
+        "concurrency": scenario["concurrency"],
+        "steps": {
+            name: summary(
+                latencies[name], errors[name], throttled[name], elapsed
+            )
+            for name in step_names
+        },
+    }
+
+
+def compare(
+        results: Dict[str, Any], baseline: Dict[str, Any], threshold: float
+) -> bool:
+    """
+    Печатает изменения относительно базового прогона
+    :return: bool
+        True, если ни один сценарий не хуже базового больше чем на
+        threshold процентов по rps или p95
+    """
+    ok: bool = True
+    for name, current in results["scenarios"].items():
+        base: Optional[Dict[str, Any]] = baseline["scenarios"].get(name)
+        if base is None:
+            continue
+        for key, higher_is_better in (
+                ("rps", True),
+                ("p50_ms", False),
+                ("p95_ms", False),
+                ("p99_ms", False),
+        ):
+            if not base[key]:
+                continue
+            change: float = (current[key] - base[key]) / base[key] * 100
+            worse: float = -change if higher_is_better else change
+            mark: str = ""
+            if worse > threshold and key in ("rps", "p95_ms"):
+                mark = "  REGRESSION"
+                ok = False
+            print(
+                f"  {name:>16} {key:>7}: {base[key]:>9} -> "
+                f"{current[key]:>9} ({change:+.1f}%){mark}"
+            )
+    return ok
+
+
+async def main(args: argparse.Namespace) -> int:
+    ranges: Dict[str, Tuple[int, int]] = {
+        "user_id": (1, args.users),
+        "tweet_id": (1, args.tweets),
+    }
+    if args.url:
+        client: httpx.AsyncClient = httpx.AsyncClient(
+            base_url=args.url, timeout=args.timeout
+        )
+    else:
+        from src.config import setting
+        from src.main import app
+
+        # замеряется обработка запросов, а не ответы 429
+        setting.rate_limit_enabled = False
+
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app),
+            base_url="http://bench",
+            timeout=args.timeout,
+        )
+
+    results: Dict[str, Any] = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "target": args.url or "asgi",
+        "scenarios": dict(),
+    }
+    async with client:
+        for name in args.scenarios:
+            scenario: Dict[str, Any] = load_scenario(name)
+            if args.requests:
+                scenario["requests"] = args.requests
+            if args.concurrency:
+                scenario["concurrency"] = args.concurrency
+            scenario_ranges: Dict[str, Tuple[int, int]] = {
+                **ranges,
+                **{
+                    key: tuple(value)
+                    for key, value in scenario.get("variables", {}).items()
+                },
+            }
+            result: Dict[str, Any] = await run_scenario(
+                client, scenario, Variables(scenario_ranges, args.seed)
+            )
+            results["scenarios"][scenario["name"]] = result
+            print(
+                f"{scenario['name']:>16}: {result['rps']} req/s, "
+                f"p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, "
+                f"p99 {result['p99_ms']} ms, errors {result['errors']}, "
+                f"throttled {result['throttled']}"
+            )
+
+    os.makedirs(PATH_RESULTS, exist_ok=True)
+    path: str = args.output or os.path.join(
+        PATH_RESULTS, f"{datetime.now():%Y%m%d_%H%M%S}.json"
+    )
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"results: {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline: Dict[str, Any] = json.load(f)
+        print(f"compared with {args.baseline}:")
+        if not compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        "scenarios", nargs="+", help="scenario names from bench/scenarios"
+    )
+    parser.add_argument("--url", help="server address, default: in process")
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--tweets", type=int, default=1)
+    parser.add_argument("--requests", type=int, help="override scenario")
+    parser.add_argument("--concurrency", type=int, help="override scenario")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="results file")
+    parser.add_argument("--baseline", help="results file to compare with")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=10.0,
+        help="allowed regression of rps and p95, percent",
+    )
+    sys.exit(asyncio.run(main(parser.parse_args())))
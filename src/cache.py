@@ -0,0 +1,156 @@
+"""
+Кэш готовых ответов API в памяти процесса и условные запросы (ETag).
+
+Записи вытесняются по давности использования (LRU) при превышении размера
+и по истечении ttl секунд. Данные, прочитанные из БД до очередной
+инвалидации, в кэш не попадают (см. generation), поэтому медленное
+чтение не может вернуть в кэш уже устаревший ответ.
+"""
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, Optional, Tuple, TypeVar
+
+from src import metrics
+from src.config import setting
+
+V = TypeVar("V")
+
+cache_requests_total: metrics.Counter = metrics.counter(
+    "cache_requests_total",
+    "Response cache lookups by cache and result (hit, miss)",
+    ("cache", "result"),
+)
+cache_invalidations_total: metrics.Counter = metrics.counter(
+    "cache_invalidations_total",
+    "Response cache entries invalidated by writes",
+    ("cache",),
+)
+
+
+class LRUCache(Generic[V]):
+    """Ограниченный по размеру кэш с вытеснением давно не используемых"""
+
+    def __init__(
+            self,
+            name: str,
+            maxsize: int,
+            ttl: float = 0.0,
+            clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name: str = name
+        self.maxsize: int = maxsize
+        self.ttl: float = ttl
+        self.clock: Callable[[], float] = clock
+        # ключ -> (значение, момент устаревания)
+        self.entries: OrderedDict[Hashable, Tuple[V, float]] = OrderedDict()
+        # растет при каждой инвалидации
+        self.generation: int = 0
+        metrics.gauge(
+            f"{name}_entries",
+            f"Entries in the {name} response cache",
+            lambda: len(self.entries),
+        )
+
+    def get(self, key: Hashable) -> Optional[V]:
+        entry: Optional[Tuple[V, float]] = self.entries.get(key)
+        if entry is None or (self.ttl and entry[1] <= self.clock()):
+            cache_requests_total.inc((self.name, "miss"))
+            return None
+        self.entries.move_to_end(key)
+        cache_requests_total.inc((self.name, "hit"))
+        return entry[0]
+
+    def set(self, key: Hashable, value: V, generation: int) -> None:
+        """
+        Сохраняет значение, если после начала его чтения из БД
+        не было инвалидаций
+        :param generation: int
+            значение self.generation перед чтением из БД
+        """
+        if generation != self.generation or self.maxsize <= 0:
+            return
+        self.entries[key] = (value, self.clock() + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, *keys: Hashable) -> None:
+        """Удаляет записи после изменения данных"""
+        self.generation += 1
+        for key in keys:
+            if self.entries.pop(key, None) is not None:
+                cache_invalidations_total.inc((self.name,))
+
+    def clear(self) -> None:
+        self.generation += 1
+        self.entries.clear()
+
+
+def make_etag(body: bytes) -> str:
+    """
+    Сильный ETag по содержимому ответа
+    :param body: bytes
+        тело ответа
+    :return: str
+        значение заголовка ETag
+    """
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Проверка заголовка If-None-Match: клиент уже имеет эту версию ответа
+    :param if_none_match: Optional[str]
+        значение заголовка If-None-Match запроса
+    :param etag: str
+        текущий ETag ответа
+    :return: bool
+        True - можно ответить 304 Not Modified
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # слабое сравнение: W/"x" совпадает с "x"
+    return etag.removeprefix("W/") in {
+        i_tag.strip().removeprefix("W/") for i_tag in if_none_match.split(",")
+    }
+
+
+class VersionCounter:
+    """
+    Версия данных процесса: растет после каждой записи, которая меняет
+    данные. Эпоха (PID и время запуска) различает счетчики процессов,
+    поэтому ETag одного процесса не совпадает с ETag другого; после fork
+    (gunicorn с preload_app) эпоха создается заново
+    """
+
+    def __init__(self):
+        self.pid: int = 0
+        self._epoch: str = ""
+        self.value: int = 0
+
+    @property
+    def epoch(self) -> str:
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self._epoch = f"{self.pid:x}.{time.time_ns():x}"
+        return self._epoch
+
+    def bump(self) -> None:
+        """Вызывается после фиксации записи (commit)"""
+        self.value += 1
+
+    def etag(self, value: Optional[int] = None) -> str:
+        return f'W/"{self.epoch}.{self.value if value is None else value}"'
+
+
+# версия ленты: создание и удаление твитов, лайки
+feed_version: VersionCounter = VersionCounter()
+
+# сериализованные ответы GET /api/users/{id}: ID -> (тело, ETag)
+profile_cache: LRUCache[Tuple[bytes, str]] = LRUCache(
+    "profile_cache", setting.profile_cache_size, setting.profile_cache_ttl
+)
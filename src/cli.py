@@ -0,0 +1,100 @@
+"""
+Служебные команды:
+
+    python -m src.cli seed        создать таблицы и начальные данные
+    python -m src.cli generate    загрузить синтетический набор данных
+    python -m src.cli worker      выполнять фоновые задания (таблица jobs)
+"""
+import argparse
+import asyncio
+import logging
+import signal
+from typing import Optional
+
+from src.config import setting
+from src.database import engine
+from src.dataset import DatasetSize, load_dataset
+from src.jobs import run_workers
+from src.startup import seed_db
+
+
+async def run_seed() -> None:
+    await seed_db()
+    await engine.dispose()
+
+
+async def run_worker(concurrency: int) -> None:
+    stop: asyncio.Event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for i_signal in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(i_signal, stop.set)
+    await run_workers(concurrency, stop)
+    await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m src.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser(
+        "seed", help="create tables and initial data in an empty database"
+    )
+    generate = commands.add_parser(
+        "generate",
+        help="bulk-load a reproducible synthetic dataset (tables must exist)",
+    )
+    defaults: DatasetSize = DatasetSize()
+    generate.add_argument("--users", type=int, default=defaults.users)
+    generate.add_argument(
+        "--avg-following", type=float, default=defaults.avg_following
+    )
+    generate.add_argument(
+        "--avg-tweets", type=float, default=defaults.avg_tweets
+    )
+    generate.add_argument(
+        "--avg-likes", type=float, default=defaults.avg_likes
+    )
+    generate.add_argument(
+        "--media-ratio", type=float, default=defaults.media_ratio
+    )
+    generate.add_argument("--alpha", type=float, default=defaults.alpha)
+    generate.add_argument("--seed", type=int, default=defaults.seed)
+    generate.add_argument(
+        "--truncate",
+        action="store_true",
+        help="remove existing users, tweets, likes and follows first",
+    )
+    worker = commands.add_parser(
+        "worker", help="run background jobs until SIGINT or SIGTERM"
+    )
+    worker.add_argument(
+        "--concurrency",
+        type=int,
+        default=max(1, setting.jobs_workers),
+        help="jobs processed at the same time",
+    )
+    args = parser.parse_args()
+
+    if args.command == "seed":
+        asyncio.run(run_seed())
+    elif args.command == "generate":
+        size: DatasetSize = DatasetSize(
+            users=args.users,
+            avg_following=args.avg_following,
+            avg_tweets=args.avg_tweets,
+            avg_likes=args.avg_likes,
+            media_ratio=args.media_ratio,
+            alpha=args.alpha,
+            seed=args.seed,
+        )
+        error: Optional[str] = asyncio.run(
+            load_dataset(size, truncate=args.truncate)
+        )
+        if error is not None:
+            parser.exit(1, f"{error}\n")
+    elif args.command == "worker":
+        logging.basicConfig(level=logging.INFO)
+        asyncio.run(run_worker(args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
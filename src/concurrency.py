@@ -0,0 +1,262 @@
+"""
+Адаптивное ограничение числа одновременно обрабатываемых запросов.
+
+Запросы к /api/ делятся на классы: чтение, запись и загрузка файлов.
+У каждого класса свой предел одновременных запросов; сверх предела запрос
+ждет в очереди не дольше concurrency_queue_timeout секунд, а при полной
+очереди или истечении ожидания сразу получает ответ 503.
+
+Предел подстраивается по задержке (AIMD): каждый успешный быстрый ответ
+увеличивает его на 1 / limit (примерно +1 за limit ответов), а ответ 5xx
+или задержка больше базовой задержки своего маршрута в
+concurrency_latency_tolerance раз уменьшает предел в BACKOFF раз, не чаще
+раза за время такого ответа. Так при замедлении БД запросы не копятся в
+процессе, а быстро отклоняются.
+
+Базовая задержка маршрута - перцентиль concurrency_baseline_percentile
+задержек его последних concurrency_baseline_window ответов. Ответы 304 и
+ответы из кэша (request.state.cache_hit) не обращаются к БД и в нее не
+входят, иначе быстрые ответы занижали бы базу и обычные запросы
+считались бы медленными.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional
+
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src import metrics
+from src.config import setting
+
+# во сколько раз уменьшается предел при перегрузке
+BACKOFF = 0.9
+
+ROUTE_CLASSES = ("reads", "writes", "uploads")
+
+load_shed_total: metrics.Counter = metrics.counter(
+    "load_shed_total",
+    "Requests rejected with 503 by the concurrency limiter",
+    ("route_class", "reason"),
+)
+
+
+def route_class(method: str, path: str) -> Optional[str]:
+    """
+    Класс маршрута для ограничения одновременных запросов
+    :param method: str
+        HTTP-метод
+    :param path: str
+        путь запроса
+    :return: Optional[str]
+        reads, writes, uploads или None, если запрос не ограничивается
+    """
+    if not path.startswith("/api/") or method == "OPTIONS":
+        return None
+    if method in ("GET", "HEAD"):
+        return "reads"
+    if method == "POST" and path.rstrip("/") == "/api/medias":
+        return "uploads"
+    return "writes"
+
+
+class AdaptiveLimiter:
+    """Предел одновременных запросов одного класса маршрутов"""
+
+    def __init__(
+            self,
+            name: str,
+            clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name: str = name
+        self.clock: Callable[[], float] = clock
+        self.limit: float = float(setting.concurrency_initial_limit)
+        self.in_flight: int = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.next_decrease: float = 0.0
+        # маршрут -> задержки последних ответов и базовая задержка
+        self.latencies: Dict[str, Deque[float]] = dict()
+        self.baselines: Dict[str, float] = dict()
+
+    async def acquire(self) -> Optional[str]:
+        """
+        Занимает место для запроса, при необходимости ожидая в очереди
+        :return: Optional[str]
+            None - место получено, иначе причина отказа
+            (queue_full, timeout)
+        """
+        if self.in_flight < int(self.limit) and not self.waiters:
+            self.in_flight += 1
+            return None
+        if len(self.waiters) >= setting.concurrency_queue_size:
+            return "queue_full"
+
+        waiter: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(
+                asyncio.shield(waiter), setting.concurrency_queue_timeout
+            )
+        except asyncio.TimeoutError:
+            if waiter.done():
+                # место выдано одновременно с истечением ожидания
+                return None
+            waiter.cancel()
+            self.waiters.remove(waiter)
+            return "timeout"
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._free()
+            else:
+                waiter.cancel()
+                self.waiters.remove(waiter)
+            raise
+        return None
+
+    def release(
+            self,
+            latency: float,
+            overloaded: bool = False,
+            route: Optional[str] = None,
+    ) -> None:
+        """
+        Освобождает место и подстраивает предел
+        :param latency: float
+            время обработки запроса, секунд
+        :param overloaded: bool
+            запрос завершился ошибкой сервера
+        :param route: Optional[str]
+            маршрут для сравнения с его базовой задержкой (None - задержка
+            не учитывается: ответ 304 или из кэша)
+        """
+        slow: bool = False
+        if route is not None:
+            baseline: Optional[float] = self.baselines.get(route)
+            slow = baseline is not None and latency > (
+                baseline * setting.concurrency_latency_tolerance
+                + setting.concurrency_latency_slack_ms / 1000
+            )
+            self.observe(route, latency)
+        if overloaded or slow:
+            now: float = self.clock()
+            if now >= self.next_decrease:
+                self.limit = max(
+                    float(setting.concurrency_min_limit), self.limit * BACKOFF
+                )
+                # запросы, начатые до уменьшения, не уменьшают предел снова
+                self.next_decrease = now + latency
+        elif self.in_flight * 2 >= self.limit:
+            # предел растет, только когда он действительно используется
+            self.limit = min(
+                float(setting.concurrency_max_limit),
+                self.limit + 1 / self.limit,
+            )
+        self._free()
+
+    def observe(self, route: str, latency: float) -> None:
+        """Обновляет базовую задержку маршрута"""
+        window: Optional[Deque[float]] = self.latencies.get(route)
+        if window is None:
+            window = deque(maxlen=setting.concurrency_baseline_window)
+            self.latencies[route] = window
+        window.append(latency)
+        if len(window) >= setting.concurrency_baseline_min_samples:
+            rank: float = setting.concurrency_baseline_percentile
+            self.baselines[route] = sorted(window)[
+                int((len(window) - 1) * rank)
+            ]
+
+    def _free(self) -> None:
+        self.in_flight -= 1
+        while self.waiters and self.in_flight < int(self.limit):
+            waiter: asyncio.Future = self.waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+
+
+limiters: Dict[str, AdaptiveLimiter] = {
+    name: AdaptiveLimiter(name) for name in ROUTE_CLASSES
+}
+
+
+def _register_gauges(name: str, limiter: AdaptiveLimiter) -> None:
+    metrics.gauge(
+        f"concurrency_{name}_limit",
+        f"Current adaptive concurrency limit for {name}",
+        lambda: limiter.limit,
+    )
+    metrics.gauge(
+        f"concurrency_{name}_in_flight",
+        f"Requests in progress for {name}",
+        lambda: limiter.in_flight,
+    )
+    metrics.gauge(
+        f"concurrency_{name}_queued",
+        f"Requests waiting for a concurrency slot for {name}",
+        lambda: len(limiter.waiters),
+    )
+
+
+for _name, _limiter in limiters.items():
+    _register_gauges(_name, _limiter)
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    Ограничивает число одновременных запросов к /api/ по классам
+    маршрутов, лишние запросы получают 503 с заголовком Retry-After
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app: ASGIApp = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        name: Optional[str] = None
+        if scope["type"] == "http" and setting.concurrency_limit_enabled:
+            name = route_class(scope["method"], scope["path"])
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        limiter: AdaptiveLimiter = limiters[name]
+        reason: Optional[str] = await limiter.acquire()
+        if reason is not None:
+            load_shed_total.inc((name, reason))
+            response: JSONResponse = JSONResponse(
+                status_code=503,
+                content={
+                    "result": False,
+                    "error_type": "Service Unavailable",
+                    "error_message": "Сервер перегружен, повторите запрос",
+                },
+                headers={"Retry-After": "1"},
+            )
+            await response(scope, receive, send)
+            return
+
+        start: float = time.perf_counter()
+        status: int = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # маршрут известен после обработки запроса роутером
+            route: Optional[str] = None
+            if (
+                    "route" in scope
+                    and status != 304
+                    and not scope.get("state", {}).get("cache_hit")
+            ):
+                route = f"{scope['method']} {scope['route'].path}"
+            limiter.release(
+                time.perf_counter() - start, status >= 500, route
+            )
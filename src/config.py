@@ -1,3 +1,5 @@
+from typing import List, Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Setting(BaseSettings):
@@ -7,6 +9,127 @@ class Setting(BaseSettings):
     postgres_host: str = "localhost"
     postgres_port: int = 5438
 
+    # пул соединений с БД
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = False
+    db_statement_cache_size: int = 100
 
-setting = Setting()
+    # реплики БД только для чтения (JSON-список DSN postgresql+asyncpg://)
+    db_replica_urls: List[str] = []
+    # через сколько секунд снова пробовать недоступную реплику
+    db_replica_retry_interval: float = 30.0
+    # сколько секунд после записи читать данные пользователя с основной БД
+    db_read_your_writes_window: float = 5.0
+
+    # проверка N+1: порог повторений одного запроса за HTTP-запрос (0 - нет)
+    nplusone_threshold: int = 0
+    nplusone_raise: bool = False
+
+    # журнал медленных запросов (0 - выключен)
+    slow_query_threshold_ms: float = 500.0
+    slow_query_log_file: str = ""
+    # доля медленных SELECT, для которых сохраняется EXPLAIN ANALYZE
+    slow_query_explain_rate: float = 0.0
+
+    # профилирование: ключ для заголовка x-profile (пусто - выключено)
+    profile_key: str = ""
+    profile_dir: str = "profiles"
+    # выборочное профилирование каждого N-го запроса к маршруту
+    profile_sample_route: str = ""
+    profile_sample_rate: int = 0
+
+    # общий каталог метрик процессов при запуске нескольких worker-ов
+    metrics_multiproc_dir: str = ""
+
+    # full - создать таблицы и начальные данные при старте,
+    # fast - только проверить ревизию БД (данные: python -m src.cli seed)
+    startup_mode: Literal["full", "fast"] = "full"
+
+    # сервер приложения (gunicorn + uvicorn workers)
+    web_bind: str = "0.0.0.0:8000"
+    # 0 - по числу ядер процессора
+    web_workers: int = 0
+    # перезапуск процесса после обработки стольких запросов (0 - без)
+    web_max_requests: int = 10000
+    web_max_requests_jitter: int = 1000
+    web_graceful_timeout: int = 30
+    web_preload_app: bool = False
+    # адреса прокси (через запятую), которым можно верить в X-Forwarded-For:
+    # адрес клиента нужен для ограничения частоты запросов без ключа
+    web_forwarded_allow_ips: str = "127.0.0.1"
 
+    # ограничение частоты запросов по ключу api-key (token bucket):
+    # rate - запросов в секунду, burst - емкость корзины
+    rate_limit_enabled: bool = True
+    # memory - в памяти процесса, postgres - общая для всех worker-ов
+    rate_limit_backend: Literal["memory", "postgres"] = "memory"
+    rate_limit_likes_rate: float = 5.0
+    rate_limit_likes_burst: int = 20
+    rate_limit_feed_rate: float = 2.0
+    rate_limit_feed_burst: int = 10
+    rate_limit_default_rate: float = 20.0
+    rate_limit_default_burst: int = 100
+    # как часто удалять заполнившиеся (простаивающие) корзины, секунд
+    rate_limit_sweep_interval: float = 60.0
+    # сколько ключей api-key, найденных в users, помнить для лимита по ключу
+    rate_limit_keys_cache_size: int = 100000
+    rate_limit_keys_cache_ttl: float = 3600.0
+
+    # адаптивный предел одновременных запросов по классам маршрутов
+    # (чтение, запись, загрузка файлов), подстраивается по задержке (AIMD)
+    concurrency_limit_enabled: bool = True
+    concurrency_initial_limit: int = 20
+    concurrency_min_limit: int = 2
+    concurrency_max_limit: int = 200
+    # сколько запросов и сколько секунд могут ждать свободного места
+    concurrency_queue_size: int = 100
+    concurrency_queue_timeout: float = 2.0
+    # перегрузка: задержка больше базовой задержки маршрута в tolerance раз
+    # плюс slack миллисекунд
+    concurrency_latency_tolerance: float = 2.0
+    concurrency_latency_slack_ms: float = 50.0
+    # базовая задержка маршрута: перцентиль задержек последних window
+    # ответов (не меньше min_samples), без ответов 304 и из кэша
+    concurrency_baseline_window: int = 200
+    concurrency_baseline_percentile: float = 0.1
+    concurrency_baseline_min_samples: int = 20
+
+    # кэш ответов GET /api/users/{id} (0 - выключен); ttl ограничивает
+    # устаревание данных при нескольких worker-ах (0 - без срока)
+    profile_cache_size: int = 10000
+    profile_cache_ttl: float = 60.0
+
+    # сброс кэшей в остальных процессах после записи: notify - через
+    # LISTEN/NOTIFY, poll - опросом таблицы outbox (если LISTEN недоступен,
+    # например за pgbouncer в режиме транзакций), off - выключен
+    invalidation_mode: Literal["notify", "poll", "off"] = "notify"
+    invalidation_channel: str = "cache_invalidation"
+    # ключи за столько секунд отправляются одним уведомлением
+    invalidation_batch_interval: float = 0.05
+    # больше ключей одного кэша в пакете - сброс этого кэша целиком
+    invalidation_max_keys: int = 500
+    invalidation_poll_interval: float = 1.0
+    invalidation_reconnect_interval: float = 5.0
+
+    # уведомления о лайках и подписках собираются в одну запись за
+    # интервал notifications_bucket секунд; сколько авторов хранить в ней
+    notifications_bucket: int = 3600
+    notifications_max_actors: int = 10
+
+    # фоновые задания (таблица jobs): число обработчиков в процессе
+    # приложения (0 - только отдельным процессом python -m src.cli worker)
+    jobs_workers: int = 1
+    # как часто проверять очередь, если заданий нет, секунд
+    jobs_poll_interval: float = 1.0
+    jobs_max_attempts: int = 5
+    # задержка повтора: retry_base * 2^(попытка - 1), не больше retry_max
+    jobs_retry_base: float = 2.0
+    jobs_retry_max: float = 300.0
+    # задание в работе дольше стольких секунд считается брошенным
+    jobs_lock_timeout: float = 300.0
+
+
+setting = Setting()
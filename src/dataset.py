@@ -0,0 +1,220 @@
+"""
+Генератор воспроизводимого набора данных для замеров производительности.
+
+Одинаковые параметры и seed дают одинаковые данные:
+- пользователи с ключами test, test1, test2, ... (как в add_data_to_db);
+- подписки со степенным распределением: число подписок пользователя
+  случайно, вероятность подписаться на пользователя убывает с его номером
+  как 1 / rank ** alpha, поэтому у небольшой части пользователей почти все
+  подписчики;
+- твиты с прикрепленными медиафайлами у части из них;
+- лайки по закону Ципфа: число лайков твита пропорционально
+  1 / rank ** alpha для случайной перестановки твитов.
+
+Данные загружаются командой COPY (asyncpg copy_records_to_table) с
+явными id и ключами, поэтому загрузка возможна только в пустые таблицы
+(или с truncate).
+"""
+import itertools
+import random
+import time
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple
+
+import asyncpg  # type: ignore[import-untyped]
+
+from src.config import setting
+from src.utils import API_KEY_DEFAULT
+
+CHUNK_SIZE = 50000
+
+DATASET_TABLES = (
+    "users", "followers", "tweets", "tweet_medias", "likes_tweet"
+)
+
+
+@dataclass
+class DatasetSize:
+    users: int = 1000
+    avg_following: float = 20.0
+    avg_tweets: float = 5.0
+    avg_likes: float = 10.0
+    media_ratio: float = 0.2
+    alpha: float = 1.1
+    seed: int = 42
+
+
+def _cum_weights(count: int, alpha: float) -> List[float]:
+    """Накопленные веса 1 / rank ** alpha для выбора по степенному закону"""
+    return list(
+        itertools.accumulate(1 / rank ** alpha for rank in range(1, count + 1))
+    )
+
+
+def gen_users(size: DatasetSize) -> Iterator[Tuple[int, str, str]]:
+    for id_user in range(1, size.users + 1):
+        apy_key: str = (
+            API_KEY_DEFAULT
+            if id_user == 1
+            else f"{API_KEY_DEFAULT}{id_user - 1}"
+        )
+        yield id_user, f"user{id_user}", apy_key
+
+
+def gen_followers(size: DatasetSize) -> Iterator[Tuple[int, int]]:
+    rng: random.Random = random.Random(f"{size.seed}-followers")
+    cum_weights: List[float] = _cum_weights(size.users, size.alpha)
+    population: range = range(1, size.users + 1)
+    for id_user in population:
+        count: int = min(
+            int(rng.expovariate(1 / size.avg_following)), size.users - 1
+        )
+        following = set(
+            rng.choices(population, cum_weights=cum_weights, k=count)
+        )
+        following.discard(id_user)
+        for id_following in sorted(following):
+            yield id_user, id_following
+
+
+def gen_tweets(
+        size: DatasetSize,
+) -> Iterator[Tuple[int, str, List[int], int, List[Tuple[int, str]]]]:
+    """
+    Строки таблицы tweets вместе со строками tweet_medias их файлов.
+    Последовательность воспроизводима, поэтому для загрузки двух таблиц
+    ее можно пройти дважды, не держа твиты в памяти
+    """
+    rng: random.Random = random.Random(f"{size.seed}-tweets")
+    id_tweet: int = 0
+    id_media: int = 0
+    for id_user in range(1, size.users + 1):
+        for _ in range(int(rng.expovariate(1 / size.avg_tweets))):
+            id_tweet += 1
+            medias: List[Tuple[int, str]] = list()
+            if rng.random() < size.media_ratio:
+                for _ in range(rng.randint(1, 3)):
+                    id_media += 1
+                    medias.append((id_media, f"generated_{id_media}.jpg"))
+            yield (
+                id_tweet,
+                f"tweet {id_tweet} by user{id_user}",
+                [i_media[0] for i_media in medias],
+                id_user,
+                medias,
+            )
+
+
+def gen_likes(
+        size: DatasetSize, count_tweets: int
+) -> Iterator[Tuple[int, int]]:
+    rng: random.Random = random.Random(f"{size.seed}-likes")
+    if not count_tweets:
+        return
+    weights: List[float] = [
+        1 / rank ** size.alpha for rank in range(1, count_tweets + 1)
+    ]
+    # число лайков твита пропорционально его весу, в среднем avg_likes
+    scale: float = size.avg_likes * count_tweets / sum(weights)
+    ranks: List[int] = list(range(1, count_tweets + 1))
+    rng.shuffle(ranks)
+    for id_tweet, rank in enumerate(ranks, start=1):
+        count: int = min(round(weights[rank - 1] * scale), size.users)
+        for id_user in sorted(rng.sample(range(1, size.users + 1), count)):
+            yield id_user, id_tweet
+
+
+def _chunks(rows: Iterator[tuple]) -> Iterator[List[tuple]]:
+    while True:
+        chunk: List[tuple] = list(itertools.islice(rows, CHUNK_SIZE))
+        if not chunk:
+            return
+        yield chunk
+
+
+async def _copy(
+        conn: asyncpg.Connection,
+        table: str,
+        columns: List[str],
+        rows: Iterator[tuple],
+) -> int:
+    start: float = time.perf_counter()
+    count: int = 0
+    for chunk in _chunks(iter(rows)):
+        await conn.copy_records_to_table(table, records=chunk, columns=columns)
+        count += len(chunk)
+    print(f"{table}: {count} rows in {time.perf_counter() - start:.1f} s")
+    return count
+
+
+async def load_dataset(
+        size: DatasetSize, truncate: bool = False
+) -> Optional[str]:
+    """
+    Генерирует набор данных и загружает его в БД из настроек Setting
+    :param size: DatasetSize
+        параметры набора данных
+    :param truncate: bool
+        предварительно очистить таблицы
+    :return: Optional[str]
+        None или сообщение об ошибке, если таблицы не пусты
+    """
+    conn: asyncpg.Connection = await asyncpg.connect(
+        user=setting.postgres_user,
+        password=setting.postgres_password,
+        database=setting.postgres_db,
+        host=setting.postgres_host,
+        port=setting.postgres_port,
+    )
+    try:
+        if truncate:
+            await conn.execute(
+                "TRUNCATE likes_tweet, followers, tweets, tweet_medias, users "
+                "RESTART IDENTITY CASCADE"
+            )
+        else:
+            filled: List[str] = [
+                table
+                for table in DATASET_TABLES
+                if await conn.fetchval(f"SELECT EXISTS (SELECT FROM {table})")
+            ]
+            if filled:
+                return (
+                    f"Tables not empty & Таблицы {', '.join(filled)} уже "
+                    f"содержат данные, id и ключи набора совпали бы с "
+                    f"существующими: запустите с --truncate"
+                )
+        await _copy(
+            conn, "users", ["id", "name", "apy_key_user"], gen_users(size)
+        )
+        await _copy(
+            conn, "followers", ["user_id", "following_id"],
+            gen_followers(size),
+        )
+        await _copy(
+            conn, "tweet_medias", ["media_id", "name_file"],
+            (i_media for i_row in gen_tweets(size) for i_media in i_row[4]),
+        )
+        count_tweets: int = await _copy(
+            conn, "tweets", ["id", "tweet_data", "tweet_media_ids", "user_id"],
+            (i_row[:4] for i_row in gen_tweets(size)),
+        )
+        await _copy(
+            conn, "likes_tweet", ["user_id", "tweet_id"],
+            gen_likes(size, count_tweets),
+        )
+        # id заданы явно, поэтому последовательности нужно сдвинуть
+        for table, column in (
+                ("users", "id"),
+                ("tweets", "id"),
+                ("tweet_medias", "media_id"),
+        ):
+            await conn.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'),"
+                f" COALESCE((SELECT max({column}) FROM {table}), 0) + 1,"
+                f" false)"
+            )
+        await conn.execute("ANALYZE")
+        return None
+    finally:
+        await conn.close()
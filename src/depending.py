@@ -1,14 +1,125 @@
-from typing import AsyncGenerator
+import math
+import time
+from collections import OrderedDict
+from typing import AsyncGenerator, Optional
+
+from fastapi import Request, Response
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database import LocalAsyncSession
+from src.config import setting
+from src.database import LocalAsyncSession, replicas
+
+# cookie с моментом (epoch, секунды), до которого клиент читает с основной
+# БД: действует во всех процессах, а не только в записавшем
+READ_YOUR_WRITES_COOKIE = "rw_until"
+
+# время последней записи по ключу пользователя (в порядке записи) - для
+# клиентов без cookie, действует только в этом процессе
+_last_write: OrderedDict[str, float] = OrderedDict()
+
+
+def _remember_write(api_key: Optional[str]) -> None:
+    """Запоминает время записи, чтобы читать свои данные с основной БД"""
+    if not api_key:
+        return
+    now: float = time.monotonic()
+    _last_write[api_key] = now
+    _last_write.move_to_end(api_key)
+    # старые отметки больше не влияют на выбор БД
+    while now - next(iter(_last_write.values())) > (
+            setting.db_read_your_writes_window
+    ):
+        _last_write.popitem(last=False)
+
+
+def _wrote_recently(request: Request) -> bool:
+    try:
+        until: float = float(
+            request.cookies.get(READ_YOUR_WRITES_COOKIE, "0")
+        )
+    except ValueError:
+        until = 0.0
+    if until > time.time():
+        return True
+    api_key: Optional[str] = request.headers.get("api-key")
+    if not api_key or api_key not in _last_write:
+        return False
+    return (
+        time.monotonic() - _last_write[api_key]
+        < setting.db_read_your_writes_window
+    )
+
+
+async def release_connection(session: AsyncSession) -> None:
+    """
+    Возвращает соединение сеанса в пул сразу после последнего запроса
+    обработчика, не дожидаясь конца обработки HTTP-запроса. Транзакция
+    завершается через commit (а не rollback): для чтения это тот же
+    один запрос к БД, который иначе выполнил бы close. Сеанс остается
+    рабочим, следующий запрос возьмет соединение из пула заново
+    :param session: AsyncSession
+        сеанс базы данных
+    """
+    if session.in_transaction():
+        await session.commit()
 
 
-async def get_db() -> AsyncGenerator[AsyncSession, None]:
+async def get_db(
+        request: Request, response: Response
+) -> AsyncGenerator[AsyncSession, None]:
     """
-    Создание сеанса базы данных
+    Создание сеанса базы данных.
+    Соединение берется из пула только при первом запросе к БД, поэтому
+    обработчик, ответивший из кэша или отклонивший запрос до обращения к
+    БД, соединение не занимает; возвращается соединение при commit
+    (см. release_connection) или при закрытии сеанса.
+    Запрос записи получает cookie READ_YOUR_WRITES_COOKIE: следующие
+    db_read_your_writes_window секунд (от начала записи) клиент читает
+    с основной БД в любом процессе
     :return: AsyncGenerator[AsyncSession, None]
         сеанс базы данных
     """
+    if request.method != "GET" and setting.db_replica_urls:
+        window: float = setting.db_read_your_writes_window
+        response.set_cookie(
+            READ_YOUR_WRITES_COOKIE,
+            f"{time.time() + window:.3f}",
+            max_age=math.ceil(window),
+            httponly=True,
+            samesite="lax",
+        )
     async with LocalAsyncSession() as session:
         yield session
+    if request.method != "GET":
+        _remember_write(request.headers.get("api-key"))
+
+
+async def get_db_read(
+        request: Request,
+) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Создание сеанса базы данных для обработчиков, которые только читают.
+    Сеанс открывается на реплике, если они настроены и пользователь
+    не выполнял запись в последние db_read_your_writes_window секунд;
+    при ошибке соединения с репликой запрос повторяется на основной БД
+    (см. ReplicaSession)
+    :return: AsyncGenerator[AsyncSession, None]
+        сеанс базы данных
+    """
+    index: Optional[int] = None
+    if not _wrote_recently(request):
+        index = replicas.pick()
+
+    if index is None:
+        async with LocalAsyncSession() as session:
+            yield session
+        return
+
+    async with replicas.sessionmakers[index]() as session:
+        try:
+            yield session
+        except (DBAPIError, OSError) as exc:
+            if isinstance(exc, OSError) or exc.connection_invalidated:
+                replicas.mark_down(index)
+            raise
@@ -0,0 +1,62 @@
+"""
+Настройки gunicorn для запуска приложения в продакшене:
+
+    python -m gunicorn -c src/gunicorn_conf.py src.main:app
+
+Перечитать код без простоя: kill -HUP <pid мастер-процесса>
+"""
+import multiprocessing
+import os
+
+from src.config import setting
+
+bind = setting.web_bind
+workers = setting.web_workers or multiprocessing.cpu_count()
+# uvicorn сам выбирает uvloop и httptools, если они установлены
+worker_class = "uvicorn.workers.UvicornWorker"
+max_requests = setting.web_max_requests
+max_requests_jitter = setting.web_max_requests_jitter
+graceful_timeout = setting.web_graceful_timeout
+preload_app = setting.web_preload_app
+# адрес клиента берется из X-Forwarded-For только от этих прокси (nginx)
+forwarded_allow_ips = setting.web_forwarded_allow_ips
+accesslog = "-"
+# сообщения приложения (logging.getLogger("src. ...")) выводятся в stderr
+logconfig_dict = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "generic": {
+            "format": "%(asctime)s %(levelname)s [%(name)s] %(message)s",
+        },
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": "generic"},
+    },
+    "loggers": {
+        "src": {"level": "INFO", "handlers": ["console"], "propagate": False},
+    },
+}
+
+
+def on_starting(server) -> None:
+    """Удаляет метрики процессов, оставшиеся от прошлого запуска"""
+    directory: str = setting.metrics_multiproc_dir
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    for file_name in os.listdir(directory):
+        if file_name.endswith(".json"):
+            os.remove(os.path.join(directory, file_name))
+
+
+def post_fork(server, worker) -> None:
+    """
+    При preload_app движок создан в мастер-процессе: соединения пула
+    нельзя делить между процессами, поэтому процесс открывает свои
+    """
+    from src.database import engine, replicas
+
+    engine.sync_engine.dispose(close=False)
+    for i_engine in replicas.engines:
+        i_engine.sync_engine.dispose(close=False)
@@ -0,0 +1,136 @@
+"""
+Учет SQL-запросов, выполненных в рамках текущего HTTP-запроса.
+
+Обработчики событий подключены к классу Engine, поэтому учитываются
+запросы всех движков (основная БД, реплики, тестовая БД).
+
+При nplusone_threshold > 0 запросы группируются по отпечатку (текст SQL
+без значений) и повторение одного отпечатка больше порога за один
+HTTP-запрос считается проблемой N+1: она пишется в лог, а при
+nplusone_raise=True запрос завершается ошибкой NPlusOneError.
+"""
+import logging
+import re
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import Scope
+
+from src import slow_queries
+from src.config import setting
+
+logger = logging.getLogger(__name__)
+
+_RE_IN_LIST = re.compile(r"\bIN \([^()]*\)", re.IGNORECASE)
+_RE_PARAM = re.compile(r"\$\d+|%\(\w+\)s")
+_RE_NUMBER = re.compile(r"\b\d+\b")
+_RE_SPACES = re.compile(r"\s+")
+
+
+class NPlusOneError(Exception):
+    pass
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(statement: str) -> str:
+    """
+    Отпечаток SQL-запроса: текст без значений параметров и длины списков
+    :param statement: str
+        текст запроса, переданный драйверу БД
+    :return: str
+        нормализованный текст запроса
+    """
+    result: str = _RE_IN_LIST.sub("IN (?)", statement)
+    result = _RE_PARAM.sub("?", result)
+    result = _RE_NUMBER.sub("?", result)
+    return _RE_SPACES.sub(" ", result).strip()
+
+
+class RequestStats:
+    """Статистика одного HTTP-запроса"""
+
+    __slots__ = (
+        "start", "scope", "db_count", "db_time", "fingerprints", "nplusone"
+    )
+
+    def __init__(self, scope: Optional[Scope] = None):
+        self.start: float = time.perf_counter()
+        self.scope: Optional[Scope] = scope
+        self.db_count: int = 0
+        self.db_time: float = 0.0
+        # счетчики отпечатков ведутся только при включенной проверке N+1
+        self.fingerprints: Optional[Dict[str, int]] = (
+            dict() if setting.nplusone_threshold > 0 else None
+        )
+        self.nplusone: List[str] = list()
+
+    def count_statement(self, statement: str) -> None:
+        """Учитывает запрос для проверки N+1 (если она включена)"""
+        if self.fingerprints is None:
+            return
+        key: str = fingerprint(statement)
+        count: int = self.fingerprints.get(key, 0) + 1
+        self.fingerprints[key] = count
+        if count == setting.nplusone_threshold + 1:
+            self.nplusone.append(key)
+            logger.warning(
+                "N+1 query: executed more than %d times: %s",
+                setting.nplusone_threshold,
+                key,
+            )
+            if setting.nplusone_raise:
+                raise NPlusOneError(key)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar(
+    "current_request", default=None
+)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+) -> None:
+    starts: List[float] = conn.info.setdefault("query_start", list())
+    starts.append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+) -> None:
+    duration: float = time.perf_counter() - conn.info["query_start"].pop()
+    stats: Optional[RequestStats] = current_request.get()
+    if stats is not None:
+        stats.db_count += 1
+        stats.db_time += duration
+        stats.count_statement(statement)
+    if (
+        setting.slow_query_threshold_ms
+        and duration * 1000 >= setting.slow_query_threshold_ms
+    ):
+        slow_queries.record(
+            conn,
+            statement,
+            parameters,
+            duration,
+            stats.scope if stats is not None else None,
+            executemany,
+        )
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context) -> None:
+    """Убирает отметку начала запроса, завершившегося ошибкой"""
+    if context.connection is None:
+        return
+    starts: List[float] = context.connection.info.get("query_start", list())
+    if starts:
+        starts.pop()
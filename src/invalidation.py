@@ -0,0 +1,319 @@
+"""
+Межпроцессная инвалидация кэшей (worker-ы uvicorn, контейнеры).
+
+Запись после commit вызывает bus.publish(name, *keys): кэш текущего
+процесса сбрасывается сразу, а ключи копятся и раз в
+invalidation_batch_interval секунд отправляются остальным процессам одним
+NOTIFY (при большом числе ключей - командой сбросить кэш целиком). Каждый
+процесс слушает канал (LISTEN) на отдельном соединении asyncpg, не
+занимающем пул, и сбрасывает у себя полученные ключи.
+
+Уведомления, отправленные пока соединение было разорвано, теряются,
+поэтому после переподключения кэши сбрасываются целиком, а ключи, которые
+не удалось отправить, возвращаются в очередь. Режим poll (для
+pgbouncer в режиме транзакций, где LISTEN не работает) вместо уведомлений
+читает события таблицы outbox.
+"""
+import asyncio
+import json
+import logging
+import uuid
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+import asyncpg  # type: ignore[import-untyped]
+from sqlalchemy import Row
+from sqlalchemy.exc import SQLAlchemyError
+
+from src import metrics, outbox, queries
+from src.cache import feed_version, profile_cache
+from src.config import setting
+from src.database import engine
+
+logger = logging.getLogger(__name__)
+
+# предел размера payload у NOTIFY - 8000 байт
+PAYLOAD_LIMIT = 7900
+
+invalidation_messages_total: metrics.Counter = metrics.counter(
+    "invalidation_messages_total",
+    "Cache invalidation messages by direction (sent, received)",
+    ("direction",),
+)
+invalidation_resets_total: metrics.Counter = metrics.counter(
+    "invalidation_resets_total",
+    "Whole-cache resets (key overflow or missed notifications)",
+    ("name",),
+)
+
+
+class InvalidationBus:
+    """Рассылка инвалидаций кэшей между процессами"""
+
+    def __init__(self, channel: str):
+        self.channel: str = channel
+        # отличает свои уведомления от чужих
+        self.origin: str = uuid.uuid4().hex[:12]
+        # имя кэша -> (сброс ключей, сброс целиком)
+        self.caches: Dict[
+            str, Tuple[Callable[..., None], Callable[[], None]]
+        ] = dict()
+        # ключи, ожидающие отправки; None - сбросить кэш целиком
+        self.pending: Dict[str, Optional[Set[Hashable]]] = dict()
+        self.wakeup: asyncio.Event = asyncio.Event()
+        self.running: bool = False
+
+    def register(
+            self,
+            name: str,
+            invalidate: Callable[..., None],
+            reset: Callable[[], None],
+    ) -> None:
+        self.caches[name] = (invalidate, reset)
+
+    def publish(self, name: str, *keys: Hashable) -> None:
+        """
+        Сбрасывает ключи кэша name в этом процессе и ставит их в очередь
+        на отправку остальным (вызывается после commit)
+        :param name: str
+            имя зарегистрированного кэша
+        :param keys: Hashable
+            ключи (JSON-совместимые)
+        """
+        self.caches[name][0](*keys)
+        if not self.running:
+            return
+        pending: Optional[Set[Hashable]] = self.pending.setdefault(
+            name, set()
+        )
+        if pending is not None:
+            pending.update(keys)
+            if len(pending) > setting.invalidation_max_keys:
+                self.pending[name] = None
+        self.wakeup.set()
+
+    def apply(self, message: Dict[str, Any]) -> None:
+        """Сбрасывает кэши по сообщению другого процесса"""
+        for name, keys in message.get("k", dict()).items():
+            if name in self.caches:
+                self.caches[name][0](*keys)
+        for name in message.get("r", list()):
+            self.reset(name)
+
+    def reset(self, name: str) -> None:
+        if name in self.caches:
+            self.caches[name][1]()
+            invalidation_resets_total.inc((name,))
+
+    def reset_all(self) -> None:
+        for name in self.caches:
+            self.reset(name)
+
+    def take_payloads(self) -> List[str]:
+        """Забирает накопленные ключи в виде payload уведомлений"""
+        return self.to_payloads(self.take_pending())
+
+    def take_pending(self) -> Dict[str, Optional[Set[Hashable]]]:
+        """Забирает накопленные ключи"""
+        pending, self.pending = self.pending, dict()
+        return pending
+
+    def requeue(self, pending: Dict[str, Optional[Set[Hashable]]]) -> None:
+        """
+        Возвращает в очередь ключи, которые не удалось отправить: они уйдут
+        после переподключения вместе с новыми
+        :param pending: Dict[str, Optional[Set[Hashable]]]
+            ключи, забранные take_pending
+        """
+        for name, keys in pending.items():
+            queued: Optional[Set[Hashable]] = self.pending.setdefault(
+                name, set()
+            )
+            if keys is None or queued is None:
+                self.pending[name] = None
+            else:
+                queued.update(keys)
+                if len(queued) > setting.invalidation_max_keys:
+                    self.pending[name] = None
+        if self.pending:
+            self.wakeup.set()
+
+    def to_payloads(
+            self, pending: Dict[str, Optional[Set[Hashable]]]
+    ) -> List[str]:
+        """Собирает ключи в payload уведомлений (не длиннее PAYLOAD_LIMIT)"""
+        resets: List[str] = [
+            name for name, keys in pending.items() if keys is None
+        ]
+        payloads: List[str] = list()
+        message: Dict[str, Any] = {"o": self.origin, "k": dict(), "r": resets}
+        size: int = len(json.dumps(message))
+        for name, keys in pending.items():
+            if keys is None:
+                continue
+            message["k"].setdefault(name, list())
+            for key in keys:
+                item_size: int = len(json.dumps(key)) + len(name) + 8
+                if size + item_size > PAYLOAD_LIMIT:
+                    payloads.append(json.dumps(message))
+                    message = {"o": self.origin, "k": dict(), "r": list()}
+                    size = len(json.dumps(message))
+                message["k"].setdefault(name, list()).append(key)
+                size += item_size
+        if message["k"] or message["r"]:
+            payloads.append(json.dumps(message))
+        return payloads
+
+    def on_notify(self, connection, pid, channel, payload: str) -> None:
+        try:
+            message: Dict[str, Any] = json.loads(payload)
+        except ValueError:
+            return
+        if message.get("o") == self.origin:
+            return
+        invalidation_messages_total.inc(("received",))
+        self.apply(message)
+
+    async def listen(self, stop: asyncio.Event) -> None:
+        """Режим notify: LISTEN и отправка накопленных ключей"""
+        self.running = True
+        first: bool = True
+        while not stop.is_set():
+            try:
+                connection: asyncpg.Connection = await asyncpg.connect(
+                    host=setting.postgres_host,
+                    port=setting.postgres_port,
+                    user=setting.postgres_user,
+                    password=setting.postgres_password,
+                    database=setting.postgres_db,
+                )
+            except (
+                    OSError, asyncpg.PostgresError, asyncpg.InterfaceError
+            ) as exc:
+                logger.warning("invalidation bus: %s", type(exc).__name__)
+                await _wait(stop, setting.invalidation_reconnect_interval)
+                continue
+            try:
+                await connection.add_listener(self.channel, self.on_notify)
+                if not first:
+                    # пропущенные за время разрыва уведомления
+                    self.reset_all()
+                first = False
+                await self.flush_loop(connection, stop)
+            except (
+                    OSError, asyncpg.PostgresError, asyncpg.InterfaceError
+            ) as exc:
+                logger.warning("invalidation bus: %s", type(exc).__name__)
+                await _wait(stop, setting.invalidation_reconnect_interval)
+            finally:
+                connection.terminate()
+        self.running = False
+
+    async def flush_loop(
+            self, connection: asyncpg.Connection, stop: asyncio.Event
+    ) -> None:
+        while not stop.is_set():
+            await _wait(self.wakeup, 1.0)
+            if connection.is_closed():
+                raise ConnectionResetError("listen connection closed")
+            if not self.wakeup.is_set():
+                continue
+            # ключи, пришедшие за batch_interval, уходят одним уведомлением
+            await asyncio.sleep(setting.invalidation_batch_interval)
+            self.wakeup.clear()
+            pending: Dict[str, Optional[Set[Hashable]]] = self.take_pending()
+            try:
+                for i_payload in self.to_payloads(pending):
+                    await connection.execute(
+                        "SELECT pg_notify($1, $2)", self.channel, i_payload
+                    )
+                    invalidation_messages_total.inc(("sent",))
+            except BaseException:
+                # повторная отправка уже ушедших ключей безвредна, а
+                # потерянные оставили бы в других процессах старые данные
+                self.requeue(pending)
+                raise
+
+    async def poll(self, stop: asyncio.Event) -> None:
+        """Режим poll: инвалидации по событиям таблицы outbox"""
+        cursor: Optional[Tuple[int, int]] = None
+        while not stop.is_set():
+            try:
+                async with engine.connect() as conn:
+                    if cursor is None:
+                        query = await conn.execute(queries.OUTBOX_TAIL)
+                        tail: Optional[Row] = query.first()
+                        cursor = (tail.txid, tail.id) if tail else (0, 0)
+                    query = await conn.execute(
+                        queries.CHANGES_AFTER,
+                        {
+                            "txid": cursor[0],
+                            "id_event": cursor[1],
+                            "limit": setting.invalidation_max_keys,
+                        },
+                    )
+                    rows: List[Row] = list(query.all())
+            except (SQLAlchemyError, OSError) as exc:
+                logger.warning("invalidation poll: %s", type(exc).__name__)
+            else:
+                for i_row in rows:
+                    for name, keys in event_invalidations(
+                            i_row.kind, i_row.payload
+                    ):
+                        if name in self.caches:
+                            self.caches[name][0](*keys)
+                if rows:
+                    cursor = (rows[-1].txid, rows[-1].id)
+                if len(rows) == setting.invalidation_max_keys:
+                    continue
+            await _wait(stop, setting.invalidation_poll_interval)
+
+    async def run(self, stop: asyncio.Event) -> None:
+        if setting.invalidation_mode == "notify":
+            await self.listen(stop)
+        elif setting.invalidation_mode == "poll":
+            await self.poll(stop)
+
+
+def event_invalidations(
+        kind: str, payload: Dict[str, Any]
+) -> Iterable[Tuple[str, List[Hashable]]]:
+    """
+    Какие кэши сбрасывает событие outbox (для режима poll)
+    :return: Iterable[Tuple[str, List[Hashable]]]
+        пары (имя кэша, ключи)
+    """
+    if kind in (outbox.FOLLOW_CREATED, outbox.FOLLOW_DELETED):
+        yield "profile", [payload["user_id"], payload["following_id"]]
+    elif kind in (
+            outbox.TWEET_CREATED,
+            outbox.TWEET_DELETED,
+            outbox.LIKE_CREATED,
+            outbox.LIKE_DELETED,
+    ):
+        yield "feed", list()
+
+
+async def _wait(event: asyncio.Event, seconds: float) -> None:
+    try:
+        await asyncio.wait_for(event.wait(), seconds)
+    except asyncio.TimeoutError:
+        pass
+
+
+bus: InvalidationBus = InvalidationBus(setting.invalidation_channel)
+# профили GET /api/users/{id}: ключи - ID пользователей
+bus.register("profile", profile_cache.invalidate, profile_cache.clear)
+# версия ленты: ключей нет, любое изменение меняет ETag
+bus.register(
+    "feed", lambda *keys: feed_version.bump(), feed_version.bump
+)
@@ -0,0 +1,246 @@
+"""
+Фоновые задания в таблице jobs.
+
+Задание добавляется функцией enqueue в транзакции сеанса, который
+выполняет основную запись, и становится видно обработчикам только вместе
+с ней. Обработчики (asyncio-задачи) забирают задания запросом
+SELECT ... FOR UPDATE SKIP LOCKED, поэтому их можно запускать в любом
+числе процессов: в процессах приложения (jobs_workers) или отдельно
+командой python -m src.cli worker.
+
+Выполненное задание удаляется, неудачное повторяется с экспоненциальной
+задержкой, после jobs_max_attempts попыток остается со статусом failed.
+Задание процесса, завершившегося аварийно, возвращается в очередь через
+jobs_lock_timeout секунд, поэтому обработчики должны допускать
+повторное выполнение. Обработчик, работающий дольше jobs_lock_timeout,
+прерывается: иначе его задание выполнялось бы одновременно повторно.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import Row
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from src import metrics, models, queries
+from src.config import setting
+from src.database import engine
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+# тип задания -> обработчик
+handlers: Dict[str, JobHandler] = dict()
+
+jobs_total: metrics.Counter = metrics.counter(
+    "jobs_total",
+    "Finished job attempts by kind and result (done, retry, failed)",
+    ("kind", "result"),
+)
+job_wait_seconds: metrics.Histogram = metrics.histogram(
+    "job_wait_seconds",
+    "Time a job waited in the queue after becoming due",
+    ("kind",),
+)
+job_duration_seconds: metrics.Histogram = metrics.histogram(
+    "job_duration_seconds",
+    "Job handler run time",
+    ("kind",),
+)
+
+# число ожидающих заданий, обновляется обработчиками этого процесса
+_queue_depth: List[float] = [0.0]
+metrics.gauge(
+    "jobs_queue_depth",
+    "Due jobs waiting in the queue (as last seen by this process)",
+    lambda: _queue_depth[0],
+)
+
+
+def job_handler(kind: str) -> Callable[[JobHandler], JobHandler]:
+    """Регистрирует обработчик заданий типа kind"""
+
+    def register(func: JobHandler) -> JobHandler:
+        handlers[kind] = func
+        return func
+
+    return register
+
+
+def enqueue(session: AsyncSession, kind: str, payload: Dict[str, Any]) -> None:
+    """
+    Добавляет задание в транзакцию сеанса (записывается при commit)
+    :param kind: str
+        тип задания
+    :param payload: Dict[str, Any]
+        параметры задания (JSON)
+    """
+    session.add(
+        models.Job(
+            kind=kind,
+            payload=payload,
+            max_attempts=setting.jobs_max_attempts,
+        )
+    )
+
+
+async def claim_job(conn: AsyncConnection) -> Optional[Row]:
+    """
+    Захватывает одно готовое к выполнению задание
+    :param conn: AsyncConnection
+        соединение (транзакция фиксируется вызывающим)
+    :return: Optional[Row]
+        задание (id, kind, payload, attempts, max_attempts, wait) или None
+    """
+    query = await conn.execute(queries.JOB_CLAIM, {"batch": 1})
+    return query.first()
+
+
+async def process_job(job: Row) -> Optional[str]:
+    """
+    Выполняет задание
+    :param job: Row
+        захваченное задание
+    :return: Optional[str]
+        None при успехе, иначе текст ошибки
+    """
+    job_wait_seconds.observe(max(0.0, job.wait), (job.kind,))
+    handler: Optional[JobHandler] = handlers.get(job.kind)
+    if handler is None:
+        return f"LookupError: no handler for job kind {job.kind}"
+    start: float = time.perf_counter()
+    try:
+        await asyncio.wait_for(
+            handler(job.payload), setting.jobs_lock_timeout
+        )
+    except asyncio.TimeoutError:
+        return (
+            f"TimeoutError: handler ran longer than jobs_lock_timeout "
+            f"({setting.jobs_lock_timeout:.0f} s)"
+        )
+    # ошибка любого обработчика записывается в задание и планирует
+    # повтор, а не останавливает цикл обработчика
+    except Exception as exc:  # noqa: PIE786
+        return f"{type(exc).__name__}: {exc}"[:1000]
+    finally:
+        job_duration_seconds.observe(
+            time.perf_counter() - start, (job.kind,)
+        )
+    return None
+
+
+async def finish_job(
+        conn: AsyncConnection, job: Row, error: Optional[str]
+) -> str:
+    """
+    Удаляет выполненное задание или планирует повтор
+    :param conn: AsyncConnection
+        соединение (транзакция фиксируется вызывающим)
+    :param job: Row
+        захваченное задание
+    :param error: Optional[str]
+        текст ошибки выполнения
+    :return: str
+        итог: done, retry или failed
+    """
+    if error is None:
+        await conn.execute(queries.JOB_DONE, {"id_job": job.id})
+        result: str = "done"
+    elif job.attempts >= job.max_attempts:
+        await conn.execute(
+            queries.JOB_FAIL, {"id_job": job.id, "error": error}
+        )
+        logger.error("job %s (%s) failed: %s", job.id, job.kind, error)
+        result = "failed"
+    else:
+        delay: float = min(
+            setting.jobs_retry_max,
+            setting.jobs_retry_base * 2 ** (job.attempts - 1),
+        )
+        await conn.execute(
+            queries.JOB_RETRY,
+            {
+                "id_job": job.id,
+                "error": error,
+                "delay": timedelta(seconds=delay),
+            },
+        )
+        logger.warning(
+            "job %s (%s) attempt %d failed, retry in %.0f s: %s",
+            job.id, job.kind, job.attempts, delay, error,
+        )
+        result = "retry"
+    jobs_total.inc((job.kind, result))
+    return result
+
+
+async def _sleep(stop: asyncio.Event, seconds: float) -> None:
+    try:
+        await asyncio.wait_for(stop.wait(), seconds)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def work(stop: asyncio.Event) -> None:
+    """Цикл одного обработчика: выполняет задания, пока не задан stop"""
+    while not stop.is_set():
+        try:
+            async with engine.begin() as conn:
+                job: Optional[Row] = await claim_job(conn)
+            if job is None:
+                await _sleep(stop, setting.jobs_poll_interval)
+                continue
+            error: Optional[str] = await process_job(job)
+            async with engine.begin() as conn:
+                await finish_job(conn, job, error)
+        except (SQLAlchemyError, OSError) as exc:
+            logger.warning("job worker: %s", type(exc).__name__)
+            await _sleep(stop, setting.jobs_poll_interval)
+
+
+async def monitor(stop: asyncio.Event) -> None:
+    """Возвращает в очередь брошенные задания и обновляет глубину очереди"""
+    while not stop.is_set():
+        try:
+            async with engine.begin() as conn:
+                lock_timeout: timedelta = timedelta(
+                    seconds=setting.jobs_lock_timeout
+                )
+                await conn.execute(
+                    queries.JOB_REQUEUE_STALE, {"lock_timeout": lock_timeout}
+                )
+                query = await conn.execute(queries.JOB_QUEUE_DEPTH)
+                _queue_depth[0] = float(query.scalar() or 0)
+        except (SQLAlchemyError, OSError) as exc:
+            logger.warning("job monitor: %s", type(exc).__name__)
+        await _sleep(stop, max(setting.jobs_poll_interval, 5.0))
+
+
+async def run_workers(concurrency: int, stop: asyncio.Event) -> None:
+    """
+    Запускает обработчики заданий до установки stop
+    :param concurrency: int
+        число одновременно выполняемых заданий
+    :param stop: asyncio.Event
+        сигнал остановки (текущие задания завершаются)
+    """
+    logger.info("job workers started: %d", concurrency)
+    await asyncio.gather(
+        monitor(stop), *[work(stop) for _ in range(concurrency)]
+    )
+
+
+@job_handler("delete_media_files")
+async def delete_media_files(payload: Dict[str, Any]) -> None:
+    """Удаляет файлы удаленного твита из каталога media"""
+    for name_file in payload["names"]:
+        try:
+            os.remove(os.path.join("media", name_file))
+        except FileNotFoundError:
+            # уже удален при предыдущей попытке
+            pass
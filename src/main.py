@@ -1,19 +1,27 @@
-import os
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
+from typing import List
 
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from src import models
+from src import metrics
+from src.config import setting
 from src.view_users import router as router_users
 from src.view_tweets import router as router_tweets
 from src.view_medias import router as router_medias
-from src.database import LocalAsyncSession, engine
+from src.view_metrics import router as router_metrics
+from src.view_changes import router as router_changes
+from src.view_notifications import router as router_notifications
+from src.concurrency import ConcurrencyLimitMiddleware
 from src.exceptiions import UnicornException, unicorn_exception_handler
-from src.utils import (
-    add_data_to_db,
-)
+from src.invalidation import bus
+from src.jobs import run_workers
+from src.middleware import TimingMiddleware
+from src.profiling import ProfilingMiddleware
+from src.rate_limit import RateLimitMiddleware
+from src.startup import StartupTimer, check_db_revision, seed_db
 
 description = """
     API Microblogging helps you do awesome stuff. 🚀
@@ -25,22 +33,50 @@ description = """
     * **Remove tweet**
     * **Add and remove likes on tweets**
     * **Add and remove followers**
+    * **Read the change feed**
+    * **Read notifications about likes and followers**
 """  # noqa: W293
 
 
-async def create_db_and_tables() -> None:
-    """Создает базу данных и таблицы в ней"""
-    async with engine.begin() as conn:
-        await conn.run_sync(models.Base.metadata.create_all)
-
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Подготовка приложения к старту"""
-    await create_db_and_tables()
-    async with LocalAsyncSession() as session:
-        await add_data_to_db(session)
+    """
+    Подготовка приложения к старту.
+    В режиме startup_mode="fast" только сверяет ревизию БД с миграциями,
+    таблицы и начальные данные создаются командой python -m src.cli seed.
+    При jobs_workers > 0 в процессе запускаются обработчики фоновых заданий.
+    Шина инвалидации сбрасывает кэши процесса после записей в других
+    процессах (src.invalidation)
+    """
+    timer: StartupTimer = StartupTimer()
+    if setting.startup_mode == "fast":
+        with timer.phase("check_db_revision"):
+            await check_db_revision()
+    else:
+        with timer.phase("seed_db"):
+            await seed_db()
+    app.state.startup_timings = timer.timings
+
+    monitor: asyncio.Task = asyncio.create_task(
+        metrics.monitor_event_loop(1.0, setting.metrics_multiproc_dir)
+    )
+    stop: asyncio.Event = asyncio.Event()
+    tasks: List[asyncio.Task] = [asyncio.create_task(bus.run(stop))]
+    if setting.jobs_workers > 0:
+        tasks.append(
+            asyncio.create_task(run_workers(setting.jobs_workers, stop))
+        )
     yield
+    # выполняемые задания завершаются, остальные остаются в очереди
+    stop.set()
+    try:
+        await asyncio.wait_for(asyncio.gather(*tasks), 5.0)
+    except asyncio.TimeoutError:
+        pass
+    # монитор последним сохраняет метрики процесса
+    monitor.cancel()
+    with suppress(asyncio.CancelledError):
+        await monitor
 
 
 app = FastAPI(
@@ -61,6 +97,10 @@ app = FastAPI(
 
 origins = ["*"]
 
+# внутри CORS, чтобы ответы 429 и 503 тоже получали CORS-заголовки;
+# запрос сверх лимита частоты отклоняется, не занимая место в очереди
+app.add_middleware(ConcurrencyLimitMiddleware)
+app.add_middleware(RateLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -69,9 +109,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(TimingMiddleware)
+
 app.include_router(router_users)
 app.include_router(router_tweets)
 app.include_router(router_medias)
+app.include_router(router_metrics)
+app.include_router(router_changes)
+app.include_router(router_notifications)
 
 app.add_exception_handler(UnicornException, unicorn_exception_handler)
 
@@ -0,0 +1,385 @@
+import asyncio
+import json
+import os
+import resource
+import time
+from bisect import bisect_left
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+
+def _format_labels(
+        labelnames: Sequence[str], labelvalues: LabelValues
+) -> str:
+    """
+    Формирует блок меток в формате Prometheus
+    :param labelnames: Sequence[str]
+        имена меток
+    :param labelvalues: LabelValues
+        значения меток
+    :return: str
+        строка вида {name="value"} или пустая строка
+    """
+    if not labelnames:
+        return ""
+    pairs: List[str] = [
+        '{}="{}"'.format(
+            name, str(value).replace("\\", "\\\\").replace('"', '\\"')
+        )
+        for name, value in zip(labelnames, labelvalues)
+    ]
+    return "{" + ",".join(pairs) + "}"
+
+
+def _render_family(
+        name: str,
+        documentation: str,
+        type_name: str,
+        samples: Sequence[Tuple[str, str, float]],
+) -> str:
+    lines: List[str] = [
+        f"# HELP {name} {documentation}",
+        f"# TYPE {name} {type_name}",
+    ]
+    for sample_name, labels, value in samples:
+        lines.append(f"{sample_name}{labels} {value}")
+    return "\n".join(lines)
+
+
+def _add_label(labels: str, name: str, value: str) -> str:
+    """Добавляет метку в готовый блок меток"""
+    pair: str = f'{name}="{value}"'
+    if not labels:
+        return "{" + pair + "}"
+    return labels[:-1] + "," + pair + "}"
+
+
+class Metric:
+    type_name: str = "untyped"
+
+    def __init__(
+            self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ):
+        self.name: str = name
+        self.documentation: str = documentation
+        self.labelnames: Tuple[str, ...] = tuple(labelnames)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """
+        Возвращает значения метрики
+        :return: List[Tuple[str, str, float]]
+            список (имя, метки, значение)
+        """
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """Вывод метрики в текстовом формате Prometheus"""
+        return _render_family(
+            self.name, self.documentation, self.type_name, self.samples()
+        )
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def __init__(
+            self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[LabelValues, float] = dict()
+
+    def inc(self, labelvalues: LabelValues = (), amount: float = 1) -> None:
+        self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        return [
+            (self.name, _format_labels(self.labelnames, labels), value)
+            for labels, value in self.values.items()
+        ]
+
+
+class Gauge(Metric):
+    """Значение вычисляется в момент выгрузки метрик"""
+
+    type_name = "gauge"
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            callback: Callable[[], float],
+    ):
+        super().__init__(name, documentation)
+        self.callback: Callable[[], float] = callback
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        return [(self.name, "", self.callback())]
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        # по каждому набору меток: счетчики корзин, сумма, количество
+        self.values: Dict[LabelValues, List[float]] = dict()
+
+    def observe(self, value: float, labelvalues: LabelValues = ()) -> None:
+        data: Optional[List[float]] = self.values.get(labelvalues)
+        if data is None:
+            data = [0.0] * (len(self.buckets) + 2)
+            self.values[labelvalues] = data
+        index: int = bisect_left(self.buckets, value)
+        data[index] += 1
+        data[-2] += value
+        data[-1] += 1
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        result: List[Tuple[str, str, float]] = list()
+        for labels, data in self.values.items():
+            cumulative: float = 0
+            for bound, count in zip(self.buckets + (float("inf"),), data):
+                cumulative += count
+                le: str = "+Inf" if bound == float("inf") else str(bound)
+                result.append(
+                    (
+                        f"{self.name}_bucket",
+                        _format_labels(
+                            self.labelnames + ("le",), labels + (le,)
+                        ),
+                        cumulative,
+                    )
+                )
+            str_labels: str = _format_labels(self.labelnames, labels)
+            result.append((f"{self.name}_sum", str_labels, data[-2]))
+            result.append((f"{self.name}_count", str_labels, data[-1]))
+        return result
+
+
+M = TypeVar("M", bound=Metric)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = dict()
+
+    def register(self, metric: M) -> M:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """
+        Выгрузка всех метрик в текстовом формате Prometheus
+        :return: str
+            текст для ответа /metrics
+        """
+        return (
+            "\n".join(metric.render() for metric in self.metrics.values())
+            + "\n"
+        )
+
+    def write_snapshot(self, directory: str) -> None:
+        """
+        Сохраняет значения метрик процесса в файл <pid>-<запуск>.json
+        каталога, общего для всех процессов приложения: момент запуска
+        в имени не дает процессу с повторно выданным PID затереть
+        значения завершившегося
+        """
+        snapshot: Dict[str, Any] = {
+            metric.name: {
+                "documentation": metric.documentation,
+                "type": metric.type_name,
+                "samples": metric.samples(),
+            }
+            for metric in self.metrics.values()
+        }
+        path: str = os.path.join(directory, f"{_process_id()}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(snapshot, f)
+        os.replace(path + ".tmp", path)
+
+    def render_multiprocess(self, directory: str) -> str:
+        """
+        Выгрузка метрик всех процессов из общего каталога: счетчики и
+        гистограммы суммируются (в том числе завершившихся процессов),
+        значения gauge выводятся по живым процессам с меткой pid
+        :return: str
+            текст для ответа /metrics
+        """
+        self.write_snapshot(directory)
+        snapshots: List[Tuple[float, str, Dict[str, Any]]] = list()
+        for file_name in os.listdir(directory):
+            if not file_name.endswith(".json"):
+                continue
+            path: str = os.path.join(directory, file_name)
+            try:
+                with open(path) as f:
+                    snapshots.append(
+                        (os.path.getmtime(path), file_name, json.load(f))
+                    )
+            except (OSError, ValueError):
+                continue
+        families: Dict[str, Dict[str, Any]] = dict()
+        live_pids: Set[str] = set()
+        # живым считается последний по времени записи файл данного PID
+        for _, file_name, snapshot in sorted(snapshots, reverse=True):
+            pid: str = file_name.split("-")[0].removesuffix(".json")
+            alive: bool = pid not in live_pids and _pid_alive(int(pid))
+            if alive:
+                live_pids.add(pid)
+            for name, data in snapshot.items():
+                family: Dict[str, Any] = families.setdefault(
+                    name, {**data, "samples": dict()}
+                )
+                for sample_name, labels, value in data["samples"]:
+                    if data["type"] == "gauge":
+                        if not alive:
+                            continue
+                        labels = _add_label(labels, "pid", pid)
+                    key: Tuple[str, str] = (sample_name, labels)
+                    family["samples"][key] = (
+                        family["samples"].get(key, 0) + value
+                    )
+        return (
+            "\n".join(
+                _render_family(
+                    name,
+                    data["documentation"],
+                    data["type"],
+                    [
+                        (sample_name, labels, value)
+                        for (sample_name, labels), value in data[
+                            "samples"
+                        ].items()
+                    ],
+                )
+                for name, data in families.items()
+            )
+            + "\n"
+        )
+
+
+_process_ids: Dict[int, str] = dict()
+
+
+def _process_id() -> str:
+    """PID и момент запуска процесса (после fork - заново)"""
+    pid: int = os.getpid()
+    if pid not in _process_ids:
+        _process_ids.clear()
+        _process_ids[pid] = f"{pid}-{time.time_ns():x}"
+    return _process_ids[pid]
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+registry: Registry = Registry()
+
+
+def counter(
+        name: str, documentation: str, labelnames: Sequence[str] = ()
+) -> Counter:
+    return registry.register(Counter(name, documentation, labelnames))
+
+
+def gauge(
+        name: str, documentation: str, callback: Callable[[], float]
+) -> Gauge:
+    return registry.register(Gauge(name, documentation, callback))
+
+
+def histogram(
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+) -> Histogram:
+    return registry.register(
+        Histogram(name, documentation, labelnames, buckets)
+    )
+
+
+# Метрики процесса
+
+_PAGE_SIZE: int = os.sysconf("SC_PAGE_SIZE")
+
+
+def resident_memory_bytes() -> float:
+    """
+    Текущий объем резидентной памяти процесса
+    :return: float
+        байты (на системах без /proc - пиковое значение)
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+_loop_lag: List[float] = [0.0]
+
+gauge(
+    "process_resident_memory_bytes",
+    "Resident memory size in bytes",
+    resident_memory_bytes,
+)
+gauge(
+    "event_loop_lag_seconds",
+    "Delay of the last event loop lag probe beyond its scheduled time",
+    lambda: _loop_lag[0],
+)
+
+
+async def monitor_event_loop(
+        interval: float = 0.5, snapshot_dir: str = ""
+) -> None:
+    """
+    Фоновая задача: замеряет задержку цикла событий, а в режиме
+    нескольких процессов периодически сохраняет метрики процесса
+    :param interval: float
+        период замера, секунд
+    :param snapshot_dir: str
+        каталог для значений метрик процессов (пусто - не сохранять)
+    """
+    try:
+        while True:
+            start: float = time.perf_counter()
+            await asyncio.sleep(interval)
+            _loop_lag[0] = max(0.0, time.perf_counter() - start - interval)
+            if snapshot_dir:
+                registry.write_snapshot(snapshot_dir)
+    finally:
+        # значения после последнего периода не теряются при остановке
+        if snapshot_dir:
+            registry.write_snapshot(snapshot_dir)
@@ -0,0 +1,83 @@
+import json
+import logging
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src import metrics
+from src.instrumentation import RequestStats, current_request
+
+logger = logging.getLogger(__name__)
+
+http_requests_total: metrics.Counter = metrics.counter(
+    "http_requests_total",
+    "HTTP requests by route and status code",
+    ("method", "route", "status"),
+)
+http_request_duration_seconds: metrics.Histogram = metrics.histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route",
+    ("method", "route"),
+)
+
+
+class TimingMiddleware:
+    """
+    Замеряет время обработки запроса, число SQL-запросов и время в БД.
+    Значения передаются в заголовке Server-Timing, пишутся в лог
+    одной JSON-строкой (уровень INFO логгера src.middleware) и
+    учитываются в метриках запросов по маршрутам
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app: ASGIApp = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats: RequestStats = RequestStats(scope)
+        token = current_request.set(stats)
+        status: int = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers: MutableHeaders = MutableHeaders(scope=message)
+                headers.append(
+                    "Server-Timing",
+                    f"app;dur={stats.elapsed() * 1000:.1f}, "
+                    f"db;dur={stats.db_time * 1000:.1f};"
+                    f'desc="{stats.db_count} queries"',
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_request.reset(token)
+            elapsed: float = stats.elapsed()
+            route = scope.get("route")
+            route_path: str = getattr(route, "path", "unmatched")
+            http_requests_total.inc(
+                (scope["method"], route_path, str(status))
+            )
+            http_request_duration_seconds.observe(
+                elapsed, (scope["method"], route_path)
+            )
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    json.dumps(
+                        {
+                            "method": scope["method"],
+                            "path": scope["path"],
+                            "route": route_path,
+                            "status": status,
+                            "duration_ms": round(elapsed * 1000, 2),
+                            "db_queries": stats.db_count,
+                            "db_ms": round(stats.db_time * 1000, 2),
+                        }
+                    )
+                )
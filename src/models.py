@@ -1,14 +1,20 @@
 from sqlalchemy import (
     ARRAY,
+    BigInteger,
     Column,
+    DateTime,
+    Float,
     ForeignKey,
+    Index,
     Integer,
     String,
     Table,
     UniqueConstraint,
     func,
     select,
+    text,
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import backref, object_session, relationship
 
@@ -23,7 +29,9 @@ followers = Table(
     "followers",
     Base.metadata,
     Column("user_id", ForeignKey("users.id"), primary_key=True),
-    Column("following_id", ForeignKey("users.id"), primary_key=True),
+    Column(
+        "following_id", ForeignKey("users.id"), primary_key=True, index=True
+    ),
     UniqueConstraint(
         "user_id", "following_id", name="idx_unique_user_following"
     ),
@@ -36,14 +44,16 @@ class LikesTweet(Base):
         UniqueConstraint("user_id", "tweet_id", name="idx_unique_user_tweet"),
     )
     user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
-    tweet_id = Column(Integer, ForeignKey("tweets.id"), primary_key=True)
+    tweet_id = Column(
+        Integer, ForeignKey("tweets.id"), primary_key=True, index=True
+    )
 
 
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
-    apy_key_user = Column(String, nullable=False)
+    apy_key_user = Column(String, nullable=False, index=True)
 
     tweet = relationship("Tweet", back_populates="user")
     like_tweet = relationship(
@@ -68,7 +78,7 @@ class Tweet(Base):
     id = Column(Integer, primary_key=True, index=True)
     tweet_data = Column(String, nullable=False)
     tweet_media_ids = Column(ARRAY(Integer), default=[], nullable=False)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
 
     user = relationship("User", back_populates="tweet")
     like_user = relationship(
@@ -99,3 +109,101 @@ class TweetMedia(Base):
     __tablename__ = "tweet_medias"
     media_id = Column(Integer, primary_key=True, index=True)
     name_file = Column(String, nullable=False)
+
+
+# корзины ограничения частоты запросов для rate_limit_backend="postgres":
+# tat - момент (epoch, секунды), когда корзина снова будет полной
+rate_limit_buckets = Table(
+    "rate_limit_buckets",
+    Base.metadata,
+    Column("key", String, primary_key=True),
+    Column("tat", Float, nullable=False),
+)
+
+
+class Job(Base):
+    """
+    Фоновое задание. Выполненные задания удаляются, status:
+    queued - ждет выполнения с момента run_at, running - выполняется
+    (locked_at - с какого момента), failed - исчерпаны попытки
+    """
+
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index(
+            "ix_jobs_queued_run_at",
+            "run_at",
+            postgresql_where=text("status = 'queued'"),
+        ),
+    )
+    id = Column(BigInteger, primary_key=True)
+    kind = Column(String, nullable=False)
+    payload = Column(JSONB, nullable=False)
+    status = Column(String, nullable=False, server_default="queued")
+    attempts = Column(Integer, nullable=False, server_default="0")
+    max_attempts = Column(Integer, nullable=False)
+    run_at = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+    locked_at = Column(DateTime(timezone=True))
+    last_error = Column(String)
+    created_at = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+
+
+class OutboxEvent(Base):
+    """
+    Событие изменения данных (transactional outbox). Записывается в той же
+    транзакции, что и само изменение; txid - номер этой транзакции, по нему
+    (и по id) упорядочена лента изменений GET /api/changes
+    """
+
+    __tablename__ = "outbox"
+    __table_args__ = (Index("ix_outbox_txid_id", "txid", "id"),)
+    id = Column(BigInteger, primary_key=True)
+    txid = Column(
+        BigInteger, nullable=False, server_default=text("txid_current()")
+    )
+    kind = Column(String, nullable=False)
+    payload = Column(JSONB, nullable=False)
+    created_at = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+
+
+class Notification(Base):
+    """
+    Уведомление пользователя user_id, собранное из событий одного вида
+    (kind: like - лайки твита tweet_id, follow - новые подписчики) за один
+    интервал bucket: count - число событий без повторов от авторов из
+    actor_ids, actor_ids - последние notifications_max_actors авторов
+    (новые первыми)
+    """
+
+    __tablename__ = "notifications"
+    __table_args__ = (
+        Index(
+            "uq_notifications_bucket",
+            "user_id",
+            "kind",
+            "tweet_id",
+            "bucket",
+            unique=True,
+            postgresql_nulls_not_distinct=True,
+        ),
+        Index(
+            "ix_notifications_user_updated",
+            "user_id",
+            text("updated_at DESC"),
+            text("id DESC"),
+        ),
+    )
+    id = Column(BigInteger, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    kind = Column(String, nullable=False)
+    tweet_id = Column(Integer, ForeignKey("tweets.id", ondelete="CASCADE"))
+    bucket = Column(DateTime(timezone=True), nullable=False)
+    count = Column(Integer, nullable=False)
+    actor_ids = Column(ARRAY(Integer), nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
@@ -0,0 +1,93 @@
+"""
+Лента изменений данных (transactional outbox).
+
+Каждая запись в utils добавляет событие функцией add_event в ту же
+транзакцию, поэтому событие появляется тогда и только тогда, когда
+зафиксировано само изменение. Потребители (поиск, аналитика, кэши других
+узлов) читают события по порядку через GET /api/changes, передавая
+курсор next предыдущего ответа в параметре since.
+"""
+from typing import Any, List, Optional, Tuple, Union
+
+from sqlalchemy import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src import models, queries, schemas
+
+# типы событий: payload
+TWEET_CREATED = "tweet_created"  # tweet_id, user_id, media_ids
+TWEET_DELETED = "tweet_deleted"  # tweet_id, user_id
+MEDIA_CREATED = "media_created"  # media_id, user_id
+LIKE_CREATED = "like_created"  # tweet_id, user_id
+LIKE_DELETED = "like_deleted"  # tweet_id, user_id
+FOLLOW_CREATED = "follow_created"  # user_id, following_id
+FOLLOW_DELETED = "follow_deleted"  # user_id, following_id
+
+CURSOR_START = "0-0"
+# txid и id событий - bigint
+MAX_BIGINT = 2 ** 63 - 1
+
+
+def add_event(session: AsyncSession, kind: str, **payload: Any) -> None:
+    """
+    Добавляет событие в транзакцию сеанса (записывается при commit)
+    :param kind: str
+        тип события
+    :param payload: Any
+        данные события (JSON)
+    """
+    session.add(models.OutboxEvent(kind=kind, payload=payload))
+
+
+def parse_cursor(cursor: str) -> Optional[Tuple[int, int]]:
+    """
+    Разбирает курсор ленты изменений вида "<txid>-<id>"
+    :param cursor: str
+        значение параметра since
+    :return: Optional[Tuple[int, int]]
+        (txid, id) или None, если курсор некорректен или его части
+        не помещаются в bigint
+    """
+    txid, _, id_event = cursor.partition("-")
+    if not (txid.isdigit() and id_event.isdigit()):
+        return None
+    # isdigit пропускает и не ASCII-цифры, а int их не разбирает
+    if not (txid.isascii() and id_event.isascii()):
+        return None
+    if max(int(txid), int(id_event)) > MAX_BIGINT:
+        return None
+    return int(txid), int(id_event)
+
+
+async def get_changes(
+        session: AsyncSession, since: str, limit: int
+) -> Union[str, Tuple[List[schemas.Change], str]]:
+    """
+    Возвращает события после курсора since в порядке фиксации
+    :param since: str
+        курсор (next предыдущего ответа или "0-0" - с начала)
+    :param limit: int
+        наибольшее число событий в ответе
+    :return: Union[str, Tuple[List[schemas.Change], str]]
+        события и курсор для следующего запроса или сообщение об ошибке
+    """
+    cursor: Optional[Tuple[int, int]] = parse_cursor(since)
+    if cursor is None:
+        return f"Invalid cursor & Некорректный курсор since: {since}"
+    query = await session.execute(
+        queries.CHANGES_AFTER,
+        {"txid": cursor[0], "id_event": cursor[1], "limit": limit},
+    )
+    rows: List[Row] = list(query.all())
+    if rows:
+        since = f"{rows[-1].txid}-{rows[-1].id}"
+    events: List[schemas.Change] = [
+        schemas.Change(
+            id=i_row.id,
+            kind=i_row.kind,
+            payload=i_row.payload,
+            created_at=i_row.created_at,
+        )
+        for i_row in rows
+    ]
+    return events, since
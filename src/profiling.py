@@ -0,0 +1,132 @@
+"""
+Профилирование отдельных запросов через cProfile.
+
+- Запрос с заголовком x-profile, равным profile_key, выполняется под
+  профилировщиком, профиль сохраняется в каталог profile_dir, имя файла
+  возвращается в заголовке X-Profile-File. Заголовок X-Profile-Status
+  ответа: ok - профиль сохранен, busy - процесс уже профилирует другой
+  запрос и этот запрос выполнен без профилирования.
+- Если задан маршрут profile_sample_route и profile_sample_rate = N,
+  профилируется каждый N-й запрос к нему, профили суммируются в файле
+  sample_<pid>.prof каталога profile_dir.
+
+Профиль можно посмотреть командой python -m pstats <файл>.
+cProfile видит весь код потока, поэтому в профиль попадают и запросы,
+параллельно обрабатываемые тем же процессом; одновременно профилируется
+только один запрос.
+"""
+import asyncio
+import cProfile
+import hmac
+import os
+import pstats
+import threading
+import time
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.config import setting
+
+
+class ProfilingMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app: ASGIApp = app
+        self.active: bool = False
+        self.sample_counter: int = 0
+        self.sample_stats: Optional[pstats.Stats] = None
+        # профили записываются в файлы вне цикла событий, по одному
+        self.dump_lock: threading.Lock = threading.Lock()
+
+    def is_sampled(self, scope: Scope) -> bool:
+        """Каждый N-й запрос к маршруту profile_sample_route"""
+        if not setting.profile_sample_route or setting.profile_sample_rate < 1:
+            return False
+        for route in scope["app"].routes:
+            if getattr(route, "path", None) == setting.profile_sample_route:
+                if route.matches(scope)[0] == Match.FULL:
+                    self.sample_counter += 1
+                    return (
+                        self.sample_counter % setting.profile_sample_rate == 0
+                    )
+        return False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # сравнение за постоянное время: по времени ответа нельзя
+        # подобрать ключ посимвольно
+        requested: bool = bool(setting.profile_key) and hmac.compare_digest(
+            Headers(scope=scope).get("x-profile", "").encode(),
+            setting.profile_key.encode(),
+        )
+        if self.active:
+            if requested:
+                await self.app(scope, receive, _with_status(send, "busy"))
+            else:
+                await self.app(scope, receive, send)
+            return
+        sampled: bool = not requested and self.is_sampled(scope)
+        if not requested and not sampled:
+            await self.app(scope, receive, send)
+            return
+
+        os.makedirs(setting.profile_dir, exist_ok=True)
+        file_name: str = f"{time.time_ns()}_{os.getpid()}.prof"
+
+        async def send_with_file(message: Message) -> None:
+            if message["type"] == "http.response.start" and requested:
+                headers: MutableHeaders = MutableHeaders(scope=message)
+                headers.append("X-Profile-File", file_name)
+                headers.append("X-Profile-Status", "ok")
+            await send(message)
+
+        profiler: cProfile.Profile = cProfile.Profile()
+        self.active = True
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_file)
+        finally:
+            profiler.disable()
+            self.active = False
+            if requested:
+                await asyncio.to_thread(
+                    self.dump,
+                    profiler,
+                    os.path.join(setting.profile_dir, file_name),
+                )
+            else:
+                await asyncio.to_thread(self.add_sample, profiler)
+
+    def dump(self, profiler: cProfile.Profile, path: str) -> None:
+        with self.dump_lock:
+            profiler.dump_stats(path)
+
+    def add_sample(self, profiler: cProfile.Profile) -> None:
+        """Добавляет профиль к сумме выборочных профилей"""
+        with self.dump_lock:
+            self._add_sample(profiler)
+
+    def _add_sample(self, profiler: cProfile.Profile) -> None:
+        if self.sample_stats is None:
+            self.sample_stats = pstats.Stats(profiler)
+        else:
+            self.sample_stats.add(profiler)
+        self.sample_stats.dump_stats(
+            os.path.join(setting.profile_dir, f"sample_{os.getpid()}.prof")
+        )
+
+
+def _with_status(send: Send, status: str) -> Send:
+    """Добавляет к ответу заголовок X-Profile-Status"""
+
+    async def send_with_status(message: Message) -> None:
+        if message["type"] == "http.response.start":
+            MutableHeaders(scope=message).append("X-Profile-Status", status)
+        await send(message)
+
+    return send_with_status
@@ -0,0 +1,408 @@
+"""
+Заранее построенные параметризованные запросы для частых операций.
+
+Объекты запросов создаются один раз при импорте, значения передаются
+через bindparam при выполнении, поэтому ключ кэша у запроса постоянный и
+SQL компилируется один раз на процесс (далее берется из кэша компиляции
+движка, см. счетчик sqlalchemy_compiled_cache_total).
+"""
+from sqlalchemy import (ARRAY, DateTime, Float, Integer, Interval, Select,
+                        and_, any_, bindparam, case, cast, delete, desc,
+                        event, extract, false, func, literal, null, true,
+                        tuple_, update)
+from sqlalchemy.dialects.postgresql import (Insert, aggregate_order_by, array,
+                                            insert)
+from sqlalchemy.engine import Engine
+from sqlalchemy.future import select
+from sqlalchemy.orm import raiseload
+
+from src import metrics, models
+
+compiled_cache_total: metrics.Counter = metrics.counter(
+    "sqlalchemy_compiled_cache_total",
+    "Executed statements by compiled cache result (hit, miss, ...)",
+    ("result",),
+)
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _count_compiled_cache(
+        conn, cursor, statement, parameters, context, executemany
+) -> None:
+    """Учет попаданий в кэш скомпилированных запросов"""
+    if context is not None:
+        compiled_cache_total.inc((context.cache_hit.name.lower(),))
+
+
+# Пользователи
+
+# лайки пользователя (lazy="selectin") в этих запросах не нужны и не
+# загружаются лишним запросом, обращение к ним - ошибка
+USER_BY_API_KEY = (
+    select(models.User)
+    .where(models.User.apy_key_user == bindparam("apy_key_user"))
+    .options(raiseload(models.User.like_tweet))
+)
+
+USER_BY_ID = (
+    select(models.User)
+    .where(models.User.id == bindparam("id_user"))
+    .options(raiseload(models.User.like_tweet))
+)
+
+USER_ROW_BY_API_KEY = select(models.User.id, models.User.name).where(
+    models.User.apy_key_user == bindparam("apy_key_user")
+)
+
+USER_ROW_BY_ID = select(models.User.id, models.User.name).where(
+    models.User.id == bindparam("id_user")
+)
+
+USER_FOLLOW_ROWS = (
+    select(
+        true().label("is_following"),
+        models.User.id,
+        models.User.name,
+    )
+    .join(
+        models.followers,
+        models.followers.c.following_id == models.User.id,
+    )
+    .where(models.followers.c.user_id == bindparam("id_user"))
+    .union_all(
+        select(
+            false().label("is_following"),
+            models.User.id,
+            models.User.name,
+        )
+        .join(
+            models.followers,
+            models.followers.c.user_id == models.User.id,
+        )
+        .where(models.followers.c.following_id == bindparam("id_user"))
+    )
+)
+
+# Твиты, лайки и медиафайлы
+
+TWEET_OF_USER = select(models.Tweet).where(
+    models.Tweet.user_id == bindparam("id_user"),
+    models.Tweet.id == bindparam("id_tweet"),
+)
+
+LIKE_OF_USER = select(models.LikesTweet).where(
+    models.LikesTweet.user_id == bindparam("id_user"),
+    models.LikesTweet.tweet_id == bindparam("id_tweet"),
+)
+
+# лайк ставится одним запросом: пользователь по ключу, наличие твита и
+# запрет лайкать свой твит проверяются в SELECT, повторный лайк
+# пропускается; пустой RETURNING - лайк не поставлен
+_LIKES_TWEET = models.LikesTweet.__table__
+
+LIKE_INSERT = (
+    insert(_LIKES_TWEET)
+    .from_select(
+        ["user_id", "tweet_id"],
+        select(models.User.id, models.Tweet.id)
+        .join(
+            models.Tweet,
+            and_(
+                models.Tweet.id == bindparam("id_tweet"),
+                models.Tweet.user_id != models.User.id,
+            ),
+        )
+        .where(models.User.apy_key_user == bindparam("apy_key_user")),
+    )
+    .on_conflict_do_nothing()
+    .returning(_LIKES_TWEET.c.tweet_id, _LIKES_TWEET.c.user_id)
+)
+
+LIKE_DELETE = (
+    delete(_LIKES_TWEET)
+    .where(
+        _LIKES_TWEET.c.user_id == models.User.id,
+        _LIKES_TWEET.c.tweet_id == bindparam("id_tweet"),
+        models.User.apy_key_user == bindparam("apy_key_user"),
+    )
+    .returning(_LIKES_TWEET.c.tweet_id, _LIKES_TWEET.c.user_id)
+)
+
+MEDIA_NAMES = select(
+    models.TweetMedia.media_id, models.TweetMedia.name_file
+).where(models.TweetMedia.media_id.in_(bindparam("id_medias", expanding=True)))
+
+# имена прикрепленных файлов в порядке их ID в tweet_media_ids
+_FEED_ATTACHMENTS = (
+    select(
+        func.array_agg(
+            aggregate_order_by(
+                models.TweetMedia.name_file,
+                func.array_position(
+                    models.Tweet.tweet_media_ids,
+                    models.TweetMedia.media_id,
+                ),
+            )
+        )
+    )
+    .where(models.TweetMedia.media_id == any_(models.Tweet.tweet_media_ids))
+    .correlate(models.Tweet)
+    .scalar_subquery()
+)
+
+FEED_TWEETS = (
+    select(
+        models.Tweet.id,
+        models.Tweet.tweet_data,
+        models.User.id.label("author_id"),
+        models.User.name.label("author_name"),
+        _FEED_ATTACHMENTS.label("attachments"),
+    )
+    .join(models.User, models.Tweet.user_id == models.User.id)
+    .order_by(desc(models.Tweet.like_count))
+)
+
+FEED_LIKES = (
+    select(models.LikesTweet.tweet_id, models.User.id, models.User.name)
+    .join(models.User, models.LikesTweet.user_id == models.User.id)
+    .where(
+        models.LikesTweet.tweet_id.in_(bindparam("id_tweets", expanding=True))
+    )
+)
+
+# Ограничение частоты запросов (rate_limit_backend="postgres").
+# Корзина хранится в форме GCRA: вместо числа токенов - момент tat, когда
+# она снова станет полной; запрос расходует interval = 1 / rate секунд и
+# допускается, пока tat - now не превышает tolerance = burst * interval.
+# Время берется из часов БД, одинаковых для всех worker-ов.
+
+_BUCKETS = models.rate_limit_buckets
+_DB_NOW = cast(extract("epoch", func.clock_timestamp()), Float)
+_INTERVAL = bindparam("interval", type_=Float)
+
+_RATE_LIMIT_INSERT = insert(_BUCKETS).values(
+    key=bindparam("key"), tat=_DB_NOW + _INTERVAL
+)
+# excluded.tat - interval - текущее время, вычисленное для вставки
+_RATE_LIMIT_TAT = (
+    func.greatest(_BUCKETS.c.tat, _RATE_LIMIT_INSERT.excluded.tat - _INTERVAL)
+    + _INTERVAL
+)
+
+# пустой RETURNING - запрос не допущен, корзина не изменена
+RATE_LIMIT_ACQUIRE = _RATE_LIMIT_INSERT.on_conflict_do_update(
+    index_elements=[_BUCKETS.c.key],
+    set_={"tat": _RATE_LIMIT_TAT},
+    where=(
+        _RATE_LIMIT_TAT - (_RATE_LIMIT_INSERT.excluded.tat - _INTERVAL)
+        <= bindparam("tolerance", type_=Float)
+    ),
+).returning(_BUCKETS.c.tat, _DB_NOW.label("now"))
+
+RATE_LIMIT_STATE = select(_BUCKETS.c.tat, _DB_NOW.label("now")).where(
+    _BUCKETS.c.key == bindparam("key")
+)
+
+# полная корзина ничем не отличается от отсутствующей
+RATE_LIMIT_SWEEP = delete(_BUCKETS).where(_BUCKETS.c.tat <= _DB_NOW)
+
+# Фоновые задания (src/jobs.py)
+
+_JOBS = models.Job.__table__
+
+_JOB_DUE = (
+    select(_JOBS.c.id)
+    .where(_JOBS.c.status == "queued", _JOBS.c.run_at <= func.now())
+    .order_by(_JOBS.c.run_at, _JOBS.c.id)
+    .limit(bindparam("batch"))
+    .with_for_update(skip_locked=True)
+)
+
+# задания, захваченные другими обработчиками, пропускаются
+JOB_CLAIM = (
+    update(_JOBS)
+    .where(_JOBS.c.id.in_(_JOB_DUE.scalar_subquery()))
+    .values(
+        status="running",
+        locked_at=func.now(),
+        attempts=_JOBS.c.attempts + 1,
+    )
+    .returning(
+        _JOBS.c.id,
+        _JOBS.c.kind,
+        _JOBS.c.payload,
+        _JOBS.c.attempts,
+        _JOBS.c.max_attempts,
+        cast(extract("epoch", func.now() - _JOBS.c.run_at), Float).label(
+            "wait"
+        ),
+    )
+)
+
+JOB_DONE = delete(_JOBS).where(_JOBS.c.id == bindparam("id_job"))
+
+JOB_RETRY = (
+    update(_JOBS)
+    .where(_JOBS.c.id == bindparam("id_job"))
+    .values(
+        status="queued",
+        run_at=func.now() + bindparam("delay", type_=Interval),
+        locked_at=None,
+        last_error=bindparam("error"),
+    )
+)
+
+JOB_FAIL = (
+    update(_JOBS)
+    .where(_JOBS.c.id == bindparam("id_job"))
+    .values(status="failed", locked_at=None, last_error=bindparam("error"))
+)
+
+# возврат в очередь заданий обработчиков, завершившихся аварийно
+JOB_REQUEUE_STALE = (
+    update(_JOBS)
+    .where(
+        _JOBS.c.status == "running",
+        _JOBS.c.locked_at
+        < func.now() - bindparam("lock_timeout", type_=Interval),
+    )
+    .values(
+        status=case(
+            (_JOBS.c.attempts >= _JOBS.c.max_attempts, "failed"),
+            else_="queued",
+        ),
+        locked_at=None,
+        last_error="lock timeout",
+    )
+)
+
+JOB_QUEUE_DEPTH = select(func.count()).where(
+    _JOBS.c.status == "queued", _JOBS.c.run_at <= func.now()
+)
+
+_OUTBOX = models.OutboxEvent.__table__
+
+# события после курсора (txid, id). Отдаются только события транзакций
+# с номером меньше xmin текущего снимка: все такие транзакции завершены,
+# а новые получат номер не меньше xmin, поэтому событие, зафиксированное
+# позже, не окажется перед уже прочитанным курсором
+CHANGES_AFTER = (
+    select(
+        _OUTBOX.c.id,
+        _OUTBOX.c.txid,
+        _OUTBOX.c.kind,
+        _OUTBOX.c.payload,
+        _OUTBOX.c.created_at,
+    )
+    .where(
+        tuple_(_OUTBOX.c.txid, _OUTBOX.c.id)
+        > tuple_(bindparam("txid"), bindparam("id_event")),
+        _OUTBOX.c.txid < func.txid_snapshot_xmin(func.txid_current_snapshot()),
+    )
+    .order_by(_OUTBOX.c.txid, _OUTBOX.c.id)
+    .limit(bindparam("limit"))
+)
+
+# последнее событие: начальный курсор опроса outbox
+OUTBOX_TAIL = (
+    select(_OUTBOX.c.txid, _OUTBOX.c.id)
+    .order_by(desc(_OUTBOX.c.txid), desc(_OUTBOX.c.id))
+    .limit(1)
+)
+
+_NOTIFICATIONS = models.Notification.__table__
+
+
+def _notification_upsert(kind: str, recipient: Select) -> Insert:
+    """
+    Добавляет событие в уведомление получателя за текущий интервал
+    (:bucket секунд) или создает уведомление. :id_actor - автор события,
+    в actor_ids хранятся последние :max_actors авторов. События
+    пользователя о самом себе уведомлений не создают
+    :param recipient: Select
+        запрос (user_id, tweet_id) получателя уведомления
+    """
+    actor = bindparam("id_actor", type_=Integer)
+    bucket = bindparam("bucket", type_=Float)
+    rows = recipient.where(recipient.selected_columns[0] != actor).add_columns(
+        literal(kind),
+        func.to_timestamp(
+            func.floor(extract("epoch", func.now()) / bucket) * bucket
+        ),
+        literal(1),
+        array([actor]),
+        func.now(),
+    )
+    stmt = insert(_NOTIFICATIONS).from_select(
+        [
+            "user_id",
+            "tweet_id",
+            "kind",
+            "bucket",
+            "count",
+            "actor_ids",
+            "updated_at",
+        ],
+        rows,
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id", "kind", "tweet_id", "bucket"],
+        set_={
+            # событие автора из actor_ids (последних :max_actors) не
+            # увеличивает счетчик: это повтор, например лайк после снятия
+            # лайка; повтор более раннего автора считается заново
+            "count": _NOTIFICATIONS.c.count
+            + case((actor == any_(_NOTIFICATIONS.c.actor_ids), 0), else_=1),
+            "actor_ids": func.array_prepend(
+                actor,
+                func.array_remove(_NOTIFICATIONS.c.actor_ids, actor),
+                type_=ARRAY(Integer),
+            )[1:bindparam("max_actors", type_=Integer)],
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+
+
+# лайк твита :id_tweet - уведомление автору твита
+NOTIFICATION_LIKE = _notification_upsert(
+    "like",
+    select(models.Tweet.user_id, models.Tweet.id).where(
+        models.Tweet.id == bindparam("id_tweet")
+    ),
+)
+
+# подписка на пользователя :id_user
+NOTIFICATION_FOLLOW = _notification_upsert(
+    "follow",
+    select(
+        bindparam("id_user", type_=Integer),
+        null().cast(Integer),
+    ),
+)
+
+# страница уведомлений пользователя, новые первыми, после курсора
+# (updated_at, id) предыдущей страницы
+NOTIFICATIONS_PAGE = (
+    select(
+        _NOTIFICATIONS.c.id,
+        _NOTIFICATIONS.c.kind,
+        _NOTIFICATIONS.c.tweet_id,
+        _NOTIFICATIONS.c.count,
+        _NOTIFICATIONS.c.actor_ids,
+        _NOTIFICATIONS.c.updated_at,
+    )
+    .where(
+        _NOTIFICATIONS.c.user_id == bindparam("id_user"),
+        tuple_(_NOTIFICATIONS.c.updated_at, _NOTIFICATIONS.c.id)
+        < tuple_(
+            bindparam("updated_at", type_=DateTime(timezone=True)),
+            bindparam("id_notification"),
+        ),
+    )
+    .order_by(desc(_NOTIFICATIONS.c.updated_at), desc(_NOTIFICATIONS.c.id))
+    .limit(bindparam("limit"))
+)
+
+USER_NAMES = select(models.User.id, models.User.name).where(
+    models.User.id.in_(bindparam("id_users", expanding=True))
+)
@@ -0,0 +1,299 @@
+"""
+Ограничение частоты запросов по ключу api-key (token bucket).
+
+Для каждой группы маршрутов (лайки, лента, остальные /api/) и каждого
+ключа ведется своя корзина емкостью burst токенов, пополняемая со
+скоростью rate токенов в секунду; запрос расходует один токен. Запрос без
+токена получает ответ 429 с заголовком Retry-After, остальные ответы -
+заголовки RateLimit-Limit, RateLimit-Remaining и RateLimit-Reset.
+
+Своя корзина есть только у ключа, который приложение уже нашло в таблице
+users (remember_key): запросы без ключа и с непроверенным ключом
+ограничиваются по адресу клиента, поэтому перебор случайных ключей не
+обходит лимит и не создает запросов к БД. Первый запрос с верным ключом
+тоже учитывается по адресу.
+
+Корзины хранятся в памяти процесса (rate_limit_backend="memory") или в
+таблице rate_limit_buckets (rate_limit_backend="postgres") - тогда лимит
+общий для всех worker-ов ценой одного запроса к БД на HTTP-запрос. Вместо
+ключа в имени корзины хранится его хэш.
+"""
+import hashlib
+import logging
+import math
+import re
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Pattern, Tuple, Union
+
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import SQLAlchemyError
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src import metrics, queries
+from src.cache import LRUCache
+from src.config import setting
+from src.database import engine
+
+logger = logging.getLogger(__name__)
+
+rate_limited_total: metrics.Counter = metrics.counter(
+    "rate_limited_total",
+    "Requests rejected with 429 by rate limit policy",
+    ("policy",),
+)
+
+# ключи api-key, найденные в таблице users
+known_keys: LRUCache[bool] = LRUCache(
+    "rate_limit_keys",
+    setting.rate_limit_keys_cache_size,
+    setting.rate_limit_keys_cache_ttl,
+)
+
+# методы, шаблон пути, группа маршрутов; первое совпадение
+ROUTES: List[Tuple[Tuple[str, ...], Pattern[str], str]] = [
+    (("POST", "DELETE"), re.compile(r"^/api/tweets/\d+/likes/?$"), "likes"),
+    (("GET",), re.compile(r"^/api/tweets/?$"), "feed"),
+    (
+        ("GET", "POST", "PUT", "PATCH", "DELETE"),
+        re.compile(r"^/api/"),
+        "default",
+    ),
+]
+
+
+@dataclass(frozen=True)
+class RatePolicy:
+    name: str
+    # токенов в секунду
+    rate: float
+    # емкость корзины
+    burst: int
+
+
+@dataclass(frozen=True)
+class Decision:
+    allowed: bool
+    limit: int
+    remaining: int
+    # через сколько секунд корзина снова будет полной
+    reset_after: float
+    # через сколько секунд появится токен (для отклоненного запроса)
+    retry_after: float
+
+    def headers(self) -> Dict[str, str]:
+        headers: Dict[str, str] = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(math.ceil(self.reset_after)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+def policy_for(method: str, path: str) -> Optional[RatePolicy]:
+    """
+    Возвращает политику ограничения для запроса
+    :param method: str
+        HTTP-метод
+    :param path: str
+        путь запроса
+    :return: Optional[RatePolicy]
+        политика или None, если запрос не ограничивается
+    """
+    for methods, pattern, name in ROUTES:
+        if method in methods and pattern.match(path):
+            return RatePolicy(
+                name,
+                getattr(setting, f"rate_limit_{name}_rate"),
+                getattr(setting, f"rate_limit_{name}_burst"),
+            )
+    return None
+
+
+class MemoryBackend:
+    """
+    Корзины в памяти процесса: ключ -> [токены, время обновления,
+    время заполнения]. Заполнившиеся корзины удаляются не чаще раза в
+    rate_limit_sweep_interval секунд
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock: Callable[[], float] = clock
+        self.buckets: Dict[str, List[float]] = dict()
+        self.next_sweep: float = clock() + setting.rate_limit_sweep_interval
+
+    async def acquire(self, key: str, policy: RatePolicy) -> Decision:
+        now: float = self.clock()
+        if now >= self.next_sweep:
+            self.sweep(now)
+
+        bucket: Optional[List[float]] = self.buckets.get(key)
+        if bucket is None:
+            tokens: float = float(policy.burst)
+        else:
+            tokens = min(
+                float(policy.burst),
+                bucket[0] + (now - bucket[1]) * policy.rate,
+            )
+        allowed: bool = tokens >= 1
+        if allowed:
+            tokens -= 1
+        reset_after: float = (policy.burst - tokens) / policy.rate
+        self.buckets[key] = [tokens, now, now + reset_after]
+        return Decision(
+            allowed=allowed,
+            limit=policy.burst,
+            remaining=int(tokens),
+            reset_after=reset_after,
+            retry_after=0.0 if allowed else (1 - tokens) / policy.rate,
+        )
+
+    def sweep(self, now: float) -> None:
+        """Удаляет корзины, которые уже заполнились"""
+        for key in [
+            i_key for i_key, i_bucket in self.buckets.items()
+            if i_bucket[2] <= now
+        ]:
+            del self.buckets[key]
+        self.next_sweep = now + setting.rate_limit_sweep_interval
+
+
+class PostgresBackend:
+    """
+    Корзины в таблице rate_limit_buckets, общие для всех worker-ов
+    (запросы RATE_LIMIT_* в src/queries.py). При ошибке БД запрос
+    пропускается без ограничения
+    """
+
+    def __init__(self) -> None:
+        self.next_sweep: float = (
+            time.monotonic() + setting.rate_limit_sweep_interval
+        )
+
+    async def acquire(self, key: str, policy: RatePolicy) -> Decision:
+        interval: float = 1 / policy.rate
+        tolerance: float = policy.burst * interval
+        try:
+            async with engine.begin() as conn:
+                if time.monotonic() >= self.next_sweep:
+                    self.next_sweep = (
+                        time.monotonic() + setting.rate_limit_sweep_interval
+                    )
+                    await conn.execute(queries.RATE_LIMIT_SWEEP)
+                query = await conn.execute(
+                    queries.RATE_LIMIT_ACQUIRE,
+                    {"key": key, "interval": interval, "tolerance": tolerance},
+                )
+                row = query.first()
+                allowed: bool = row is not None
+                if not allowed:
+                    query = await conn.execute(
+                        queries.RATE_LIMIT_STATE, {"key": key}
+                    )
+                    row = query.first()
+        except (SQLAlchemyError, OSError) as exc:
+            logger.warning("rate limit backend failed: %s", type(exc).__name__)
+            return Decision(True, policy.burst, policy.burst, 0.0, 0.0)
+
+        reset_after: float = max(0.0, row.tat - row.now) if row else 0.0
+        return Decision(
+            allowed=allowed,
+            limit=policy.burst,
+            remaining=max(0, int((tolerance - reset_after) / interval)),
+            reset_after=reset_after,
+            retry_after=(
+                0.0 if allowed else reset_after + interval - tolerance
+            ),
+        )
+
+
+def remember_key(api_key: str) -> None:
+    """
+    Отмечает ключ api-key как принадлежащий пользователю (вызывается
+    после того, как запрос обработчика нашел пользователя по ключу)
+    """
+    known_keys.set(api_key, True, known_keys.generation)
+
+
+def is_known_key(api_key: Optional[str]) -> bool:
+    """Ключ api-key уже найден в таблице users (см. remember_key)"""
+    return bool(api_key) and bool(known_keys.get(api_key))
+
+
+def client_key(scope: Scope) -> str:
+    """
+    Имя корзины клиента: хэш проверенного ключа api-key, иначе адрес
+    клиента
+    :param scope: Scope
+        запрос
+    :return: str
+        имя корзины без имени политики
+    """
+    api_key: Optional[str] = Headers(scope=scope).get("api-key")
+    if api_key and is_known_key(api_key):
+        digest: str = hashlib.blake2b(
+            api_key.encode(), digest_size=16
+        ).hexdigest()
+        return f"key:{digest}"
+    client = scope.get("client")
+    return f"ip:{client[0] if client else ''}"
+
+
+class RateLimitMiddleware:
+    """
+    Ограничивает частоту запросов к /api/ по ключу api-key (без ключа или
+    с непроверенным ключом - по адресу клиента) согласно политикам ROUTES
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app: ASGIApp = app
+        self.backend: Union[MemoryBackend, PostgresBackend] = (
+            PostgresBackend()
+            if setting.rate_limit_backend == "postgres"
+            else MemoryBackend()
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not setting.rate_limit_enabled:
+            await self.app(scope, receive, send)
+            return
+        policy: Optional[RatePolicy] = policy_for(
+            scope["method"], scope["path"]
+        )
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        decision: Decision = await self.backend.acquire(
+            f"{policy.name}:{client_key(scope)}", policy
+        )
+
+        if not decision.allowed:
+            rate_limited_total.inc((policy.name,))
+            response: JSONResponse = JSONResponse(
+                status_code=429,
+                content={
+                    "result": False,
+                    "error_type": "Too Many Requests",
+                    "error_message": (
+                        f"Превышен лимит запросов ({policy.name}), "
+                        f"повторите через "
+                        f"{decision.headers()['Retry-After']} с"
+                    ),
+                },
+                headers=decision.headers(),
+            )
+            await response(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers: MutableHeaders = MutableHeaders(scope=message)
+                for name, value in decision.headers().items():
+                    headers.append(name, value)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
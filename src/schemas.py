@@ -1,4 +1,5 @@
-from typing import List
+from datetime import datetime
+from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel, Field
 
@@ -49,3 +50,29 @@ class Tweet(BaseModel):
 
 class Tweets(ResultClass):
     tweets: List[Tweet] = Field(title="List of Tweets")
+
+
+class Change(BaseModel):
+    id: int = Field(title="ID Event")
+    kind: str = Field(title="Event type")
+    payload: Dict[str, Any] = Field(title="Event data")
+    created_at: datetime = Field(title="Commit time")
+
+
+class Changes(ResultClass):
+    changes: List[Change] = Field(title="Events in commit order")
+    next: str = Field(title="Cursor for the next request (since)")
+
+
+class Notification(BaseModel):
+    id: int = Field(title="ID Notification")
+    kind: str = Field(title="Notification type (like, follow)")
+    tweet_id: Optional[int] = Field(title="ID of the liked Tweet")
+    count: int = Field(title="Number of users")
+    actors: List[User] = Field(title="Latest users, newest first")
+    updated_at: datetime = Field(title="Time of the latest event")
+
+
+class Notifications(ResultClass):
+    notifications: List[Notification] = Field(title="Newest first")
+    next: Optional[str] = Field(title="Cursor of the next page (before)")
@@ -0,0 +1,80 @@
+"""
+Объединение одновременных одинаковых вычислений (single-flight).
+
+Первый вызов с данным ключом выполняет вычисление, а вызовы с тем же
+ключом, пришедшие до его завершения, ждут и получают тот же результат
+(или то же исключение) без собственных запросов к БД. Завершенные
+результаты не хранятся: следующий вызов после завершения выполняет
+вычисление заново.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+from src import metrics
+
+T = TypeVar("T")
+
+single_flight_executions_total: metrics.Counter = metrics.counter(
+    "single_flight_executions_total",
+    "Computations actually executed by single-flight group",
+    ("name",),
+)
+single_flight_coalesced_total: metrics.Counter = metrics.counter(
+    "single_flight_coalesced_total",
+    "Calls served by another in-flight computation (executions saved)",
+    ("name",),
+)
+
+
+class _LeaderCancelled(Exception):
+    """Выполнявший вычисление запрос отменен, результата не будет"""
+
+
+class SingleFlight:
+    """Группа вычислений, объединяемых по ключу"""
+
+    def __init__(self, name: str):
+        self.name: str = name
+        self.flights: Dict[Hashable, asyncio.Future] = dict()
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        Выполняет func или присоединяется к уже выполняющемуся вызову
+        :param key: Hashable
+            ключ вычисления
+        :param func: Callable[[], Awaitable[T]]
+            вычисление (например, запрос к БД в сеансе вызывающего)
+        :return: T
+            результат вычисления
+        """
+        flight: Optional[asyncio.Future] = self.flights.get(key)
+        if flight is not None:
+            try:
+                # отмена ожидающего запроса не отменяет общее вычисление
+                result: T = await asyncio.shield(flight)
+            except _LeaderCancelled:
+                return await self.do(key, func)
+            except Exception:
+                single_flight_coalesced_total.inc((self.name,))
+                raise
+            single_flight_coalesced_total.inc((self.name,))
+            return result
+
+        flight = asyncio.get_running_loop().create_future()
+        self.flights[key] = flight
+        single_flight_executions_total.inc((self.name,))
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            flight.set_exception(_LeaderCancelled())
+            raise
+        except BaseException as exc:
+            flight.set_exception(exc)
+            raise
+        else:
+            flight.set_result(result)
+            return result
+        finally:
+            del self.flights[key]
+            # исключение без ожидающих не должно попадать в лог asyncio
+            flight.exception()
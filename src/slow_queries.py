@@ -0,0 +1,155 @@
+"""
+Журнал медленных SQL-запросов.
+
+Запрос дольше slow_query_threshold_ms пишется в логгер src.slow_queries
+(и в файл slow_query_log_file с ротацией, если он задан): текст, параметры
+(значения ключей пользователей скрыты), длительность и обработчик API.
+Для доли slow_query_explain_rate медленных SELECT в фоне выполняется
+EXPLAIN (ANALYZE, BUFFERS) на отдельном соединении и план пишется туда же;
+SELECT с блокировкой строк (FOR UPDATE и т.п.) не повторяется: EXPLAIN
+ANALYZE выполняет запрос и тоже заблокировал бы строки.
+"""
+import asyncio
+import json
+import logging
+import random
+import re
+from logging.handlers import RotatingFileHandler
+from typing import Any, Optional, Set
+
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.datastructures import Headers
+from starlette.types import Scope
+
+from src.config import setting
+
+logger = logging.getLogger(__name__)
+
+if setting.slow_query_log_file:
+    _handler: RotatingFileHandler = RotatingFileHandler(
+        setting.slow_query_log_file, maxBytes=10 * 1024 * 1024, backupCount=5
+    )
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+REDACTED = "***"
+
+_LOCKING_CLAUSE = re.compile(
+    r"\bFOR\s+(UPDATE|NO\s+KEY\s+UPDATE|SHARE|KEY\s+SHARE)\b", re.IGNORECASE
+)
+
+# ссылки на фоновые задачи EXPLAIN, чтобы их не удалил сборщик мусора
+_explain_tasks: Set[asyncio.Task] = set()
+
+
+def redact(statement: str, parameters: Any, api_key: Optional[str]) -> Any:
+    """
+    Скрывает ключи пользователей в параметрах запроса
+    :param statement: str
+        текст запроса
+    :param parameters: Any
+        параметры запроса в формате драйвера БД
+    :param api_key: Optional[str]
+        ключ пользователя из заголовка api-key
+    :return: Any
+        параметры, в которых ключи (и строки, содержащие ключ текущего
+        пользователя, например ключи корзин ограничения частоты) заменены
+        на ***
+    """
+    hide_strings: bool = "apy_key_user" in statement
+
+    def hide(value: Any) -> Any:
+        if isinstance(value, str) and (
+                hide_strings or (api_key and api_key in value)
+        ):
+            return REDACTED
+        return value
+
+    if isinstance(parameters, dict):
+        return {key: hide(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [hide(value) for value in parameters]
+    return parameters
+
+
+def _endpoint(scope: Optional[Scope]) -> Optional[str]:
+    if scope is None:
+        return None
+    route = scope.get("route")
+    return f"{scope['method']} {getattr(route, 'path', scope['path'])}"
+
+
+def record(
+        conn: Any,
+        statement: str,
+        parameters: Any,
+        duration: float,
+        scope: Optional[Scope],
+        executemany: bool,
+) -> None:
+    """
+    Записывает медленный запрос в журнал и при попадании в выборку
+    запускает фоновый EXPLAIN ANALYZE
+    """
+    if statement.startswith("EXPLAIN"):
+        return
+    api_key: Optional[str] = (
+        Headers(scope=scope).get("api-key") if scope is not None else None
+    )
+    endpoint: Optional[str] = _endpoint(scope)
+    logger.warning(
+        json.dumps(
+            {
+                "slow_query_ms": round(duration * 1000, 2),
+                "endpoint": endpoint,
+                "statement": statement,
+                "parameters": redact(statement, parameters, api_key),
+            },
+            default=str,
+        )
+    )
+
+    if (
+        executemany
+        or not statement.lstrip().upper().startswith("SELECT")
+        or _LOCKING_CLAUSE.search(statement)
+        or random.random() >= setting.slow_query_explain_rate
+    ):
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    task: asyncio.Task = loop.create_task(
+        _explain(AsyncEngine(conn.engine), statement, parameters, endpoint)
+    )
+    _explain_tasks.add(task)
+    task.add_done_callback(_explain_tasks.discard)
+
+
+async def _explain(
+        engine: AsyncEngine,
+        statement: str,
+        parameters: Any,
+        endpoint: Optional[str],
+) -> None:
+    """Выполняет EXPLAIN (ANALYZE, BUFFERS) и пишет план в журнал"""
+    try:
+        async with engine.connect() as conn:
+            result = await conn.exec_driver_sql(
+                f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters
+            )
+            plan: str = "\n".join(row[0] for row in result)
+    except (SQLAlchemyError, OSError) as exc:
+        # текст ошибки не пишем: в нем значения параметров запроса
+        logger.warning(
+            "EXPLAIN ANALYZE failed for %s: %s", endpoint, type(exc).__name__
+        )
+        return
+    logger.warning(
+        json.dumps(
+            {"endpoint": endpoint, "statement": statement, "plan": plan}
+        )
+    )
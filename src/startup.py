@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from alembic import command
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+
+from src import models
+from src.database import LocalAsyncSession, engine
+from src.utils import add_data_to_db
+
+logger = logging.getLogger(__name__)
+
+PATH_PROJECT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ключ pg_advisory_lock для seed_db
+SEED_LOCK_ID = 7_270_001
+SEED_LOCK_POLL_INTERVAL = 0.5
+
+# ревизия, которой соответствуют таблицы, созданные create_all при запуске
+# до появления seed_db (в таких БД нет таблицы alembic_version)
+BASELINE_REVISION = "1b92f11345f5"
+
+
+class StartupTimer:
+    """Замер длительности этапов запуска приложения"""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = dict()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = (time.perf_counter() - start) * 1000
+            logger.info(
+                "startup phase %s took %.1f ms", name, self.timings[name]
+            )
+
+
+async def create_db_and_tables() -> None:
+    """Создает базу данных и таблицы в ней"""
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+
+
+def _migrate(connection: Connection) -> None:
+    """
+    Приводит схему БД к последней ревизии миграций:
+    - в пустой БД таблицы создаются по моделям и отмечаются ревизией head;
+    - БД без истории миграций отмечается ревизией BASELINE_REVISION;
+    - затем выполняются недостающие миграции (alembic upgrade head)
+    """
+    created: bool = not inspect(connection).has_table(
+        models.User.__tablename__
+    )
+    if created:
+        models.Base.metadata.create_all(connection)
+    context: MigrationContext = MigrationContext.configure(connection)
+    if created:
+        context.stamp(_script_directory(), "head")
+    elif context.get_current_revision() is None:
+        context.stamp(_script_directory(), BASELINE_REVISION)
+    # миграции управляют транзакциями сами (CREATE INDEX CONCURRENTLY)
+    connection.commit()
+    if not created:
+        config: Config = _alembic_config()
+        config.attributes["connection"] = connection
+        command.upgrade(config, "head")
+
+
+async def seed_db() -> None:
+    """
+    Создает или обновляет таблицы и заполняет пустую БД начальными
+    данными. Процессы, запущенные одновременно, выполняют это по очереди
+    (advisory lock на время работы), поэтому начальные данные не
+    дублируются
+    """
+    async with engine.connect() as conn:
+        while True:
+            query = await conn.execute(
+                text("SELECT pg_try_advisory_lock(:lock_id)"),
+                {"lock_id": SEED_LOCK_ID},
+            )
+            locked: bool = bool(query.scalar())
+            # ожидание не держит транзакцию: CREATE INDEX CONCURRENTLY в
+            # миграции другого процесса ждет завершения всех транзакций
+            await conn.commit()
+            if locked:
+                break
+            await asyncio.sleep(SEED_LOCK_POLL_INTERVAL)
+        try:
+            await conn.run_sync(_migrate)
+            async with LocalAsyncSession(bind=conn) as session:
+                await add_data_to_db(session)
+            await conn.commit()
+        finally:
+            await conn.rollback()
+            await conn.execute(
+                text("SELECT pg_advisory_unlock(:lock_id)"),
+                {"lock_id": SEED_LOCK_ID},
+            )
+            await conn.commit()
+
+
+def _alembic_config() -> Config:
+    config: Config = Config(os.path.join(PATH_PROJECT, "alembic.ini"))
+    config.set_main_option(
+        "script_location", os.path.join(PATH_PROJECT, "alembic")
+    )
+    return config
+
+
+def _script_directory() -> ScriptDirectory:
+    return ScriptDirectory.from_config(_alembic_config())
+
+
+def alembic_head() -> Optional[str]:
+    """
+    Возвращает последнюю ревизию миграций Alembic из кода
+    :return: Optional[str]
+        номер ревизии
+    """
+    return _script_directory().get_current_head()
+
+
+async def check_db_revision() -> None:
+    """
+    Проверяет, что схема БД обновлена до последней миграции
+    :raise RuntimeError: если ревизия БД не совпадает с кодом
+    """
+    head: Optional[str] = alembic_head()
+    async with engine.connect() as conn:
+        query = await conn.execute(
+            text("SELECT version_num FROM alembic_version")
+        )
+        revision: Optional[str] = query.scalar()
+    if revision != head:
+        raise RuntimeError(
+            f"Database revision {revision} does not match migrations head "
+            f"{head}, run 'alembic upgrade head'"
+        )
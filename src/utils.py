@@ -1,16 +1,44 @@
-import os
-from typing import List, Optional, Sequence, Tuple, Union
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence, Set, Tuple, Union, cast
 
-from sqlalchemy import and_, delete, desc
+from sqlalchemy import Row, delete
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.dialects.postgresql import Insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import joinedload, selectinload
 
-from src import models, schemas
+from src import models, queries, schemas
+from src.cache import feed_version
+from src.config import setting
+from src.invalidation import bus
+from src.jobs import enqueue
+from src.outbox import (
+    FOLLOW_CREATED,
+    FOLLOW_DELETED,
+    LIKE_CREATED,
+    LIKE_DELETED,
+    MEDIA_CREATED,
+    TWEET_CREATED,
+    MAX_BIGINT,
+    TWEET_DELETED,
+    add_event,
+    parse_cursor,
+)
+from src.rate_limit import remember_key
+from src.single_flight import SingleFlight
 
 API_KEY_DEFAULT = "test"
 
+# курсор страницы уведомлений: (updated_at в мкс от EPOCH, id)
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MAX_TIMESTAMP_US = (datetime(9999, 1, 1, tzinfo=timezone.utc) - EPOCH) // (
+    timedelta(microseconds=1)
+)
+
+# одновременные запросы одной ленты и одного профиля читают БД один раз
+feed_flight: SingleFlight = SingleFlight("feed")
+user_flight: SingleFlight = SingleFlight("user_profile")
+
 
 async def add_data_to_db(session: AsyncSession) -> None:
     """
@@ -46,9 +74,8 @@ async def check_user_is_empty(session: AsyncSession) -> bool:
     :return: bool
         состояние таблицы (True: пустая, False: с данными)
     """
-    query = await session.execute(select(models.User))
-    res = query.scalars().first()
-    return not bool(res)
+    query = await session.execute(select(models.User.id).limit(1))
+    return query.first() is None
 
 
 async def get_user_by_apy_key(
@@ -64,33 +91,76 @@ async def get_user_by_apy_key(
         данные пользователя или None, если пользователь не найден
     """
     query = await session.execute(
-        select(models.User).filter(models.User.apy_key_user == apy_key_user)
+        queries.USER_BY_API_KEY, {"apy_key_user": apy_key_user}
     )
-    return query.scalars().first()
+    data_user: Optional[models.User] = query.scalars().first()
+    if data_user is not None:
+        remember_key(apy_key_user)
+    return data_user
+
+
+async def get_user_row_by_apy_key(
+        session: AsyncSession, apy_key_user: str
+) -> Optional[Row]:
+    """
+    Возвращает строку (id, name) пользователя по ключу apy_key_user
+    :param session: AsyncSession
+        текущая сессия
+    :param apy_key_user: str
+        ключ пользователя
+    :return: Optional[Row]
+        строка пользователя или None, если пользователь не найден
+    """
+    query = await session.execute(
+        queries.USER_ROW_BY_API_KEY, {"apy_key_user": apy_key_user}
+    )
+    row: Optional[Row] = query.first()
+    if row is not None:
+        remember_key(apy_key_user)
+    return row
+
+
+async def get_user_follow_rows(
+        session: AsyncSession, id_user: int
+) -> Tuple[Sequence[Row], Sequence[Row]]:
+    """
+    Возвращает подписки и подписчиков пользователя одним запросом
+    :param id_user: int
+        ID пользователя в таблице User
+    :return: Tuple[Sequence[Row], Sequence[Row]]
+        строки (id, name) подписок и подписчиков
+    """
+    query = await session.execute(
+        queries.USER_FOLLOW_ROWS, {"id_user": id_user}
+    )
+
+    following: List[Row] = list()
+    followers: List[Row] = list()
+    for i_row in query.all():
+        if i_row.is_following:
+            following.append(i_row)
+        else:
+            followers.append(i_row)
+    return following, followers
 
 
 async def get_user_me_from_db(
         apy_key_user: Optional[str], session: AsyncSession
-) -> Union[
-    str, Tuple[models.User, Sequence[models.User], Sequence[models.User]]
-]:
+) -> Union[str, Tuple[Row, Sequence[Row], Sequence[Row]]]:
     """
     Возвращает данные текущего пользователя (для заполнения профиля)
     :param apy_key_user: Optional[str]
         ключ текущего пользователя, если не указан - первый в таблице Users
-    :return: Union[
-                str, Tuple[
-                    models.User, Sequence[models.User], Sequence[models.User]
-                    ]
-                ]
-        данные о пользователе, его подписчиках и подписках или об ошибке
+    :return: Union[str, Tuple[Row, Sequence[Row], Sequence[Row]]]
+        строки (id, name) пользователя, его подписок и подписчиков
+        или сообщение об ошибке
     """
     if not apy_key_user:
         apy_key: str = API_KEY_DEFAULT
     else:
         apy_key = apy_key_user
 
-    res: Optional[models.User] = await get_user_by_apy_key(session, apy_key)
+    res: Optional[Row] = await get_user_row_by_apy_key(session, apy_key)
 
     if not res:
         return (
@@ -99,41 +169,61 @@ async def get_user_me_from_db(
         )
 
     # Выгрузка данных по подпискам и подписчикам
-    query = await session.execute(res.following)
-    following = query.scalars().all()
-    query = await session.execute(res.followers)
-    followers = query.scalars().all()
+    following, followers = await get_user_follow_rows(session, res.id)
 
     return res, following, followers
 
 
+def read_target(session: AsyncSession) -> Optional[int]:
+    """
+    БД, с которой читает сеанс: запрос к отстающей реплике не должен
+    отдавать свой результат запросам к основной БД (single-flight)
+    :return: Optional[int]
+        номер реплики или None - основная БД
+    """
+    return session.info.get("replica_index")
+
+
 async def get_user_id(
         session: AsyncSession, id_user: int
-) -> Union[
-    str, Tuple[models.User, Sequence[models.User], Sequence[models.User]]
-]:
+) -> Union[str, Tuple[Row, Sequence[Row], Sequence[Row]]]:
+    """
+    Возвращает данные пользователя по ID.
+    Одновременные запросы одного профиля к одной БД выполняются один раз
+    :param id_user: int
+        ID пользователя в таблице User
+    :return: Union[str, Tuple[Row, Sequence[Row], Sequence[Row]]]
+        строки (id, name) пользователя, его подписок и подписчиков
+        или сообщение об ошибке
+    """
+    return await user_flight.do(
+        (read_target(session), id_user),
+        lambda: load_user_id(session, id_user),
+    )
+
+
+async def load_user_id(
+        session: AsyncSession, id_user: int
+) -> Union[str, Tuple[Row, Sequence[Row], Sequence[Row]]]:
     """
-    Возвращает данные пользователя по ID
+    Загружает из БД данные пользователя по ID (см. get_user_id)
     :param id_user: int
         ID пользователя в таблице User
-    :return: Tuple[
-            Optional[models.User],
-            Optional[Sequence[models.User]],
-            Optional[Sequence[models.User]]
-            ]
-        данные о пользователе, его подписчиках и подписках или None
-    """
-    res: Optional[models.User] = await session.get(models.User, id_user)
+    :return: Union[str, Tuple[Row, Sequence[Row], Sequence[Row]]]
+        строки (id, name) пользователя, его подписок и подписчиков
+        или сообщение об ошибке
+    """
+    query = await session.execute(
+        queries.USER_ROW_BY_ID, {"id_user": id_user}
+    )
+    res: Optional[Row] = query.first()
     if not res:
         return f"User not found & Пользователь с ID {id_user} не найден"
 
     # Выгрузка данных по подпискам и подписчикам
-    query = await session.execute(res.following)
-    following = query.scalars().all()
-    query = await session.execute(res.followers)
-    followers = query.scalars().all()
+    following, followers = await get_user_follow_rows(session, res.id)
 
-    return (res, following, followers)
+    return res, following, followers
 
 
 async def create_tweet(
@@ -153,7 +243,7 @@ async def create_tweet(
     :return: Union[str, int]
         ID созданного твиттера (при успешном добавлении в БД)
     """
-    data_user: Optional[models.User] = await get_user_by_apy_key(
+    data_user: Optional[Row] = await get_user_row_by_apy_key(
         session, apy_key_user
     )
     if not data_user:
@@ -167,7 +257,16 @@ async def create_tweet(
         user_id=data_user.id,
     )
     session.add(new_tweet)
+    await session.flush()
+    add_event(
+        session,
+        TWEET_CREATED,
+        tweet_id=new_tweet.id,
+        user_id=data_user.id,
+        media_ids=new_tweet.tweet_media_ids or list(),
+    )
     await session.commit()
+    bus.publish("feed")
     return new_tweet.id
 
 
@@ -184,7 +283,7 @@ async def add_file_media(
         ID новой записи (при успешном добавлении в БД)
     """
     new_media: models.TweetMedia = models.TweetMedia(name_file=name_file)
-    data_user: Optional[models.User] = await get_user_by_apy_key(
+    data_user: Optional[Row] = await get_user_row_by_apy_key(
         session, apy_key_user
     )
     if not data_user:
@@ -194,6 +293,13 @@ async def add_file_media(
         )
     try:
         session.add(new_media)
+        await session.flush()
+        add_event(
+            session,
+            MEDIA_CREATED,
+            media_id=new_media.media_id,
+            user_id=data_user.id,
+        )
     except SQLAlchemyError:
         await session.rollback()
         return "File not append & ошибка записи в БД"
@@ -214,7 +320,7 @@ async def delete_tweets(
     :return: Union[str, bool]
         статус выполнения операции
     """
-    data_user: Optional[models.User] = await get_user_by_apy_key(
+    data_user: Optional[Row] = await get_user_row_by_apy_key(
         session, apy_key_user
     )
     if not data_user:
@@ -225,30 +331,36 @@ async def delete_tweets(
 
     # Проверяем принадлежность твитера пользователю
     query = await session.execute(
-        select(models.Tweet).filter(
-            and_(
-                models.Tweet.user_id == data_user.id,
-                models.Tweet.id == id_tweet,
-            )
-        )
+        queries.TWEET_OF_USER, {"id_user": data_user.id, "id_tweet": id_tweet}
     )
     tweet: Optional[models.Tweet] = query.scalars().one_or_none()
     if tweet:
         tweet_media_ids: List[int] = tweet.tweet_media_ids
         try:
+            if len(tweet_media_ids) != 0:
+                # файлы удаляются фоновым заданием после фиксации удаления
+                name_files: List[str] = await name_file_from_tweet_medias(
+                    session, tweet_media_ids
+                )
+                await session.execute(
+                    delete(models.TweetMedia).filter(
+                        models.TweetMedia.media_id.in_(tweet_media_ids)
+                    )
+                )
+                if name_files:
+                    enqueue(
+                        session, "delete_media_files", {"names": name_files}
+                    )
             await session.delete(tweet)
+            add_event(
+                session, TWEET_DELETED, tweet_id=id_tweet, user_id=data_user.id
+            )
+            await session.commit()
         except SQLAlchemyError:
             await session.rollback()
             return False
         else:
-            await session.commit()
-            if len(tweet_media_ids) != 0:
-                await delete_files_from_tweet(session, tweet_media_ids)
-                stmt = delete(models.TweetMedia).filter(
-                    models.TweetMedia.media_id.in_(tweet_media_ids)
-                )
-                await session.execute(stmt)
-                await session.commit()
+            bus.publish("feed")
             return True
     else:
         return False
@@ -267,30 +379,35 @@ async def add_like_tweet(
         статус выполнения операции
     """
     query = await session.execute(
-        select(models.User)
-        .where(models.User.apy_key_user == apy_key_user)
-        .options(selectinload(models.User.like_tweet))
+        queries.LIKE_INSERT,
+        {"apy_key_user": apy_key_user, "id_tweet": id_tweet},
     )
-    data_user: Optional[models.User] = query.scalars().first()
-    if not data_user:
+    like: Optional[Row] = query.first()
+    if like is not None:
+        remember_key(apy_key_user)
+        add_event(
+            session, LIKE_CREATED, tweet_id=like.tweet_id, user_id=like.user_id
+        )
+        await add_notification(
+            session, queries.NOTIFICATION_LIKE, like.user_id, id_tweet=id_tweet
+        )
+        await session.commit()
+        bus.publish("feed")
+        return True
+
+    # Лайк не поставлен: выясняем причину
+    if await get_user_row_by_apy_key(session, apy_key_user) is None:
         return (
             f"User not found & Пользователь с ключом "
             f"{apy_key_user} не найден"
         )
-
-    tweet: models.Tweet = await session.get(models.Tweet, id_tweet)
-    # Проверка автора твита
-    if tweet.user_id == data_user.id:
-        return False
-
-    try:
-        data_user.like_tweet.append(tweet)
-    except SQLAlchemyError:
-        await session.rollback()
-        return False
-    else:
-        await session.commit()
-        return True
+    query = await session.execute(
+        select(models.Tweet.id).where(models.Tweet.id == id_tweet)
+    )
+    if query.first() is None:
+        return f"Tweet not found & Твит с ID {id_tweet} не найден"
+    # свой твит или повторный лайк
+    return False
 
 
 async def delete_like_tweet(
@@ -305,7 +422,75 @@ async def delete_like_tweet(
     :return: Union[str, bool]
         статус выполнения операции
     """
-    data_user: Optional[models.User] = await get_user_by_apy_key(
+    query = await session.execute(
+        queries.LIKE_DELETE,
+        {"apy_key_user": apy_key_user, "id_tweet": id_tweet},
+    )
+    like: Optional[Row] = query.first()
+    if like is not None:
+        remember_key(apy_key_user)
+        add_event(
+            session, LIKE_DELETED, tweet_id=like.tweet_id, user_id=like.user_id
+        )
+        await session.commit()
+        bus.publish("feed")
+        return True
+
+    if await get_user_row_by_apy_key(session, apy_key_user) is None:
+        return (
+            f"User not found & Пользователь с ключом "
+            f"{apy_key_user} не найден"
+        )
+    return False
+
+
+async def add_notification(
+        session: AsyncSession, stmt: Insert, id_actor: int, **params: int
+) -> None:
+    """
+    Учитывает событие в уведомлении получателя (в транзакции сеанса)
+    :param stmt: Insert
+        queries.NOTIFICATION_LIKE или queries.NOTIFICATION_FOLLOW
+    :param id_actor: int
+        ID пользователя, поставившего лайк или подписавшегося
+    :param params: int
+        ID твита (id_tweet) или получателя (id_user)
+    """
+    await session.execute(
+        stmt,
+        {
+            "id_actor": id_actor,
+            "bucket": setting.notifications_bucket,
+            "max_actors": setting.notifications_max_actors,
+            **params,
+        },
+    )
+
+
+async def get_notifications(
+        session: AsyncSession,
+        apy_key_user: str,
+        before: Optional[str],
+        limit: int,
+) -> Union[str, Tuple[List[schemas.Notification], Optional[str]]]:
+    """
+    Возвращает уведомления пользователя, новые первыми
+    :param apy_key_user: str
+        ключ пользователя
+    :param before: Optional[str]
+        курсор next предыдущей страницы (None - первая страница)
+    :param limit: int
+        наибольшее число уведомлений на странице
+    :return: Union[str, Tuple[List[schemas.Notification], Optional[str]]]
+        уведомления и курсор следующей страницы (None - страниц больше нет)
+        или сообщение об ошибке
+    """
+    cursor: Optional[Tuple[int, int]] = (
+        parse_cursor(before) if before else (MAX_TIMESTAMP_US, MAX_BIGINT)
+    )
+    if cursor is None or cursor[0] > MAX_TIMESTAMP_US:
+        return f"Invalid cursor & Некорректный курсор before: {before}"
+    data_user: Optional[Row] = await get_user_row_by_apy_key(
         session, apy_key_user
     )
     if not data_user:
@@ -315,25 +500,48 @@ async def delete_like_tweet(
         )
 
     query = await session.execute(
-        select(models.LikesTweet).filter(
-            and_(
-                models.LikesTweet.user_id == data_user.id,
-                models.LikesTweet.tweet_id == id_tweet,
-            )
-        )
+        queries.NOTIFICATIONS_PAGE,
+        {
+            "id_user": data_user.id,
+            "updated_at": EPOCH + timedelta(microseconds=cursor[0]),
+            "id_notification": cursor[1],
+            "limit": limit,
+        },
     )
-    like_tweet: Optional[models.LikesTweet] = query.scalars().one_or_none()
-    if like_tweet:
-        try:
-            await session.delete(like_tweet)
-        except SQLAlchemyError:
-            await session.rollback()
-            return False
-        else:
-            await session.commit()
-            return True
-    else:
-        return False
+    rows: List[Row] = list(query.all())
+    id_actors: Set[int] = {
+        i_actor for i_row in rows for i_actor in i_row.actor_ids
+    }
+    names: Dict[int, str] = dict()
+    if id_actors:
+        query = await session.execute(
+            queries.USER_NAMES, {"id_users": list(id_actors)}
+        )
+        names = cast(Dict[int, str], dict(query.tuples().all()))
+
+    next_cursor: Optional[str] = None
+    if len(rows) == limit:
+        last: Row = rows[-1]
+        next_cursor = (
+            f"{(last.updated_at - EPOCH) // timedelta(microseconds=1)}"
+            f"-{last.id}"
+        )
+    return [
+        schemas.Notification(
+            id=i_row.id,
+            kind=i_row.kind,
+            tweet_id=i_row.tweet_id,
+            # у Row есть метод count, поэтому столбец - через _mapping
+            count=i_row._mapping["count"],
+            actors=[
+                schemas.User(id=i_actor, name=names[i_actor])
+                for i_actor in i_row.actor_ids
+                if i_actor in names
+            ],
+            updated_at=i_row.updated_at,
+        )
+        for i_row in rows
+    ], next_cursor
 
 
 async def name_file_from_tweet_medias(
@@ -348,14 +556,17 @@ async def name_file_from_tweet_medias(
     :return: List[str]
         список имен файлов, или пустой
     """
-    list_name_file: List[str] = list()
-    for i_id in list_id_name_file:
-        res: Optional[models.TweetMedia] = await session.get(
-            models.TweetMedia, i_id
-        )
-        if res:
-            list_name_file.append(res.name_file)
-    return list_name_file
+    if not list_id_name_file:
+        return list()
+    query = await session.execute(
+        queries.MEDIA_NAMES, {"id_medias": list_id_name_file}
+    )
+    name_files: Dict[int, str] = cast(
+        Dict[int, str], dict(query.tuples().all())
+    )
+    return [
+        name_files[i_id] for i_id in list_id_name_file if i_id in name_files
+    ]
 
 
 async def user_following(
@@ -370,12 +581,10 @@ async def user_following(
     :return: Union[str, bool]
         статус выполнения операции
     """
-    query = await session.execute(
-        select(models.User).where(models.User.apy_key_user == apy_key_user)
+    data_user: Optional[models.User] = await get_user_by_apy_key(
+        session, apy_key_user
     )
 
-    data_user: Optional[models.User] = query.scalars().first()
-
     if not data_user:
         return (
             f"User not found & Пользователь с ключом "
@@ -384,7 +593,7 @@ async def user_following(
 
     # Поиск данных подписчика
     query = await session.execute(
-        select(models.User).where(models.User.id == id_follower)
+        queries.USER_BY_ID, {"id_user": id_follower}
     )
     user_folower: Optional[models.User] = query.scalars().first()
     if not user_folower:
@@ -394,11 +603,25 @@ async def user_following(
 
     try:
         data_user.following.append(user_folower)
+        add_event(
+            session,
+            FOLLOW_CREATED,
+            user_id=data_user.id,
+            following_id=user_folower.id,
+        )
+        await add_notification(
+            session,
+            queries.NOTIFICATION_FOLLOW,
+            cast(int, data_user.id),
+            id_user=cast(int, user_folower.id),
+        )
         await session.commit()
     except IntegrityError:
         await session.rollback()
         return False
     else:
+        # изменились подписки одного и подписчики другого
+        bus.publish("profile", data_user.id, user_folower.id)
         return True
 
 
@@ -414,10 +637,9 @@ async def user_unfollowing(
     :return: Union[str, bool]
         статус выполнения операции
     """
-    query = await session.execute(
-        select(models.User).where(models.User.apy_key_user == apy_key_user)
+    data_user: Optional[models.User] = await get_user_by_apy_key(
+        session, apy_key_user
     )
-    data_user: Optional[models.User] = query.scalars().first()
     if not data_user:
         return (
             f"User not found & Пользователь с ключом "
@@ -426,7 +648,7 @@ async def user_unfollowing(
 
     # Поиск данных подписчика
     query = await session.execute(
-        select(models.User).where(models.User.id == id_follower)
+        queries.USER_BY_ID, {"id_user": id_follower}
     )
     user_folower: Optional[models.User] = query.scalars().first()
     if not user_folower:
@@ -436,11 +658,18 @@ async def user_unfollowing(
 
     try:
         data_user.following.remove(user_folower)
+        add_event(
+            session,
+            FOLLOW_DELETED,
+            user_id=data_user.id,
+            following_id=user_folower.id,
+        )
     except SQLAlchemyError:
         session.rollback()
         return False
     else:
         await session.commit()
+        bus.publish("profile", data_user.id, user_folower.id)
         return True
 
 
@@ -455,61 +684,48 @@ async def out_tweets_user(
     :return: Union[str, List[schemas.Tweet]]]
         список твиттов пользователя
     """
-    data_user: Optional[models.User] = await get_user_by_apy_key(
-        session, apy_key_user
-    )
-    if not data_user:
+    if await get_user_row_by_apy_key(session, apy_key_user) is None:
         return (
             f"User not found & Пользователь с ключом "
             f"{apy_key_user} не найден"
         )
 
-    stmt = (
-        select(models.Tweet)
-        .options(
-            joinedload(models.Tweet.user),
-            selectinload(models.Tweet.like_user),
-        )
-        .order_by(desc(models.Tweet.like_count))
+    # лента одинакова для всех пользователей; к загрузке присоединяются
+    # только запросы той же версии ленты к той же БД, начатые до
+    # следующей записи
+    return await feed_flight.do(
+        (read_target(session), feed_version.value),
+        lambda: load_feed(session),
     )
-    query = await session.execute(stmt)
-    res = query.scalars().all()
-
-    me_tweets: List[schemas.Tweet] = list()
-    for i_res in res:  # type: models.Tweet
-        id_tweet: int = i_res.id
-        content_tweet: str = i_res.tweet_data
-        author_tweet: schemas.User = schemas.User(
-            id=i_res.user.id, name=i_res.user.name
-        )
 
-        likes_tweet: List[schemas.Like] = [
-            schemas.Like(user_id=i_like.id, name=i_like.name)
-            for i_like in i_res.like_user
-        ]
 
-        attachments_tweet: List[str] = await name_file_from_tweet_medias(
-            session, i_res.tweet_media_ids
-        )
+async def load_feed(session: AsyncSession) -> List[schemas.Tweet]:
+    """
+    Загружает из БД твиты ленты с авторами, вложениями и лайками
+    :return: List[schemas.Tweet]
+        список твитов
+    """
+    query = await session.execute(queries.FEED_TWEETS)
+    rows: Sequence[Row] = query.all()
+    if not rows:
+        return list()
 
-        tweet: schemas.Tweet = schemas.Tweet(
-            id=id_tweet,
-            content=content_tweet,
-            attachments=attachments_tweet,
-            author=author_tweet,
-            likes=likes_tweet,
+    query = await session.execute(
+        queries.FEED_LIKES, {"id_tweets": [i_row.id for i_row in rows]}
+    )
+    likes: Dict[int, List[schemas.Like]] = dict()
+    for i_tweet_id, i_user_id, i_name in query.tuples():
+        likes.setdefault(i_tweet_id, list()).append(
+            schemas.Like(user_id=i_user_id, name=i_name)
         )
-        me_tweets.append(tweet)
-
-    return me_tweets
 
-
-async def delete_files_from_tweet(
-        session: AsyncSession, id_files_tweet: List[int]
-) -> None:
-    name_files: List[str] = await name_file_from_tweet_medias(
-        session, id_files_tweet
-    )
-    for i_file in name_files:
-        name_file: str = os.path.join("media", i_file)
-        os.remove(name_file)
+    return [
+        schemas.Tweet(
+            id=i_row.id,
+            content=i_row.tweet_data,
+            attachments=i_row.attachments or list(),
+            author=schemas.User(id=i_row.author_id, name=i_row.author_name),
+            likes=likes.get(i_row.id, list()),
+        )
+        for i_row in rows
+    ]
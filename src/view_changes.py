@@ -0,0 +1,56 @@
+from typing import Annotated, List, Tuple, Union
+
+from fastapi import APIRouter, Depends, Header, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src import schemas
+from src.depending import get_db_read, release_connection
+from src.exceptiions import UnicornException
+from src.outbox import CURSOR_START, get_changes
+from src.utils import get_user_row_by_apy_key
+
+router = APIRouter(
+    prefix="/api/changes",
+    tags=["changes"],
+)
+
+
+@router.get("", status_code=200, response_model=schemas.Changes)
+async def get_api_changes(
+        api_key: Annotated[str, Header()],  # noqa: B008
+        since: str = CURSOR_START,
+        limit: Annotated[int, Query(gt=0, le=1000)] = 100,
+        session: AsyncSession = Depends(get_db_read),  # noqa: B008
+) -> schemas.Changes:
+    """
+    Обработка запроса ленты изменений: события после курсора since.
+    Пустой список означает, что новых событий пока нет; следующий запрос
+    передает в since значение next
+    :param api_key: str
+        ключ пользователя
+    :param since: str
+        курсор ("0-0" - с начала ленты)
+    :param limit: int
+        наибольшее число событий в ответе
+    :param session: AsyncSession
+        сеанс базы данных
+    :return: schemas.Changes
+        события, курсор next и статус ответа
+    """
+    res: Union[str, Tuple[List[schemas.Change], str]]
+    if await get_user_row_by_apy_key(session, api_key) is None:
+        res = (
+            f"User not found & Пользователь с ключом "
+            f"{api_key} не найден"
+        )
+    else:
+        res = await get_changes(session, since, limit)
+    await release_connection(session)
+    if isinstance(res, str):
+        err: List[str] = res.split("&")
+        raise UnicornException(
+            result=False,
+            error_type=err[0].strip(),
+            error_message=err[1].strip(),
+        )
+    return schemas.Changes(rusult=True, changes=res[0], next=res[1])
@@ -22,7 +22,7 @@ router = APIRouter(
 )
 
 
-@router.post("/", status_code=201, response_model=schemas.MediaOut)
+@router.post("", status_code=201, response_model=schemas.MediaOut)
 async def post_medias(
         file: UploadFile,
         api_key: Annotated[str, Header()],  # noqa: B008
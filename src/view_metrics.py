@@ -0,0 +1,28 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from src import metrics
+from src.config import setting
+
+router = APIRouter(
+    tags=["metrics"],
+)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics() -> PlainTextResponse:
+    """
+    Метрики приложения в текстовом формате Prometheus
+    :return: PlainTextResponse
+        значения всех зарегистрированных метрик
+    """
+    if setting.metrics_multiproc_dir:
+        content: str = metrics.registry.render_multiprocess(
+            setting.metrics_multiproc_dir
+        )
+    else:
+        content = metrics.registry.render()
+    return PlainTextResponse(
+        content,
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
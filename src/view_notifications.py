@@ -0,0 +1,54 @@
+from typing import Annotated, List, Optional, Tuple, Union
+
+from fastapi import APIRouter, Depends, Header, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src import schemas
+from src.depending import get_db_read, release_connection
+from src.exceptiions import UnicornException
+from src.utils import get_notifications
+
+router = APIRouter(
+    prefix="/api/notifications",
+    tags=["notifications"],
+)
+
+
+@router.get("", status_code=200, response_model=schemas.Notifications)
+async def get_api_notifications(
+        api_key: Annotated[str, Header()],  # noqa: B008
+        before: Optional[str] = None,
+        limit: Annotated[int, Query(gt=0, le=100)] = 20,
+        session: AsyncSession = Depends(get_db_read),  # noqa: B008
+) -> schemas.Notifications:
+    """
+    Обработка запроса уведомлений текущего пользователя о лайках его
+    твитов и новых подписчиках. Следующая страница запрашивается с
+    before, равным next предыдущего ответа
+    :param api_key: str
+        ключ пользователя
+    :param before: Optional[str]
+        курсор страницы (None - первая страница)
+    :param limit: int
+        наибольшее число уведомлений на странице
+    :param session: AsyncSession
+        сеанс базы данных
+    :return: schemas.Notifications
+        уведомления, курсор next и статус ответа
+    """
+    res: Union[
+        str, Tuple[List[schemas.Notification], Optional[str]]
+    ] = await get_notifications(
+        session=session, apy_key_user=api_key, before=before, limit=limit
+    )
+    await release_connection(session)
+    if isinstance(res, str):
+        err: List[str] = res.split("&")
+        raise UnicornException(
+            result=False,
+            error_type=err[0].strip(),
+            error_message=err[1].strip(),
+        )
+    return schemas.Notifications(
+        rusult=True, notifications=res[0], next=res[1]
+    )
@@ -1,16 +1,19 @@
-from typing import List, Union, Annotated
+from typing import List, Optional, Union, Annotated
 
 from fastapi import APIRouter, Depends, Header, Response, Path
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src import schemas
-from src.depending import get_db
+from src.cache import etag_matches, feed_version
+from src.depending import get_db, release_connection
 from src.exceptiions import UnicornException
+from src.rate_limit import is_known_key
 from src.utils import (
     add_like_tweet,
     create_tweet,
     delete_like_tweet,
     delete_tweets,
+    get_user_row_by_apy_key,
     out_tweets_user,
 )
 
@@ -20,7 +23,7 @@ router = APIRouter(
 )
 
 
-@router.post("/", status_code=201, response_model=schemas.TweetOut)
+@router.post("", status_code=201, response_model=schemas.TweetOut)
 async def post_api_tweets(
         tweet: schemas.TweetIn,
         api_key: Annotated[str, Header()],  # noqa: B008
@@ -165,23 +168,49 @@ async def delete_tweet_likes(
     return schemas.ResultClass(rusult=res)
 
 
-@router.get("/", status_code=200, response_model=schemas.Tweets)
+@router.get("", status_code=200, response_model=schemas.Tweets)
 async def get_tweets_user(
+        response: Response,
         api_key: Annotated[str, Header()],  # noqa: B008
+        if_none_match: Annotated[Optional[str], Header()] = None,
         session: AsyncSession = Depends(get_db),
-) -> schemas.Tweets:
+) -> Union[schemas.Tweets, Response]:
     """
-    Обработка запроса на получение ленты с твитами
+    Обработка запроса на получение ленты с твитами.
+    ETag ленты - версия feed_version: если клиент уже имеет текущую
+    версию (If-None-Match), возвращается 304 без чтения ленты. Версия
+    меняется при фиксации записей на основной БД, поэтому лента тоже
+    читается с нее: с отстающей реплики под новым ETag закрепилась бы
+    старая лента
     :param api_key: str
         ключ пользователя
+    :param if_none_match: Optional[str]
+        ETag сохраненной клиентом версии ленты
     :param session: AsyncSession
         сеанс базы данных
-    :return: schemas.Tweets
+    :return: Union[schemas.Tweets, Response]
         список твитов и статус ответа
     """
+    # версия берется до чтения ленты: запись во время чтения только
+    # сделает ETag старее данных, и клиент перезапросит ленту
+    etag: str = feed_version.etag()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        # 304 отдается только существующему пользователю
+        if not is_known_key(api_key) and (
+                await get_user_row_by_apy_key(session, api_key) is None
+        ):
+            raise UnicornException(
+                result=False,
+                error_type="User not found",
+                error_message=f"Пользователь с ключом {api_key} не найден",
+            )
+        return Response(status_code=304, headers=headers)
+
     res: Union[str, List[schemas.Tweet]] = await out_tweets_user(
         session=session, apy_key_user=api_key
     )
+    await release_connection(session)
     if isinstance(res, str):
         err: List[str] = res.split("&")
         raise UnicornException(
@@ -189,4 +218,5 @@ async def get_tweets_user(
             error_type=err[0].strip(),
             error_message=err[1].strip(),
         )
+    response.headers.update(headers)
     return schemas.Tweets(rusult=True, tweets=res)
@@ -1,11 +1,13 @@
 from fastapi import APIRouter
-from typing import List, Sequence, Tuple, Union, Annotated
+from typing import List, Optional, Sequence, Tuple, Union, Annotated
 
-from fastapi import Depends, Header, Response, Path
+from fastapi import Depends, Header, Request, Response, Path
+from sqlalchemy import Row
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src import models, schemas
-from src.depending import get_db
+from src import schemas
+from src.cache import etag_matches, make_etag, profile_cache
+from src.depending import get_db, get_db_read, release_connection
 from src.exceptiions import UnicornException
 from src.utils import (
     get_user_id,
@@ -23,7 +25,7 @@ router = APIRouter(
 @router.get("/me", status_code=200, response_model=schemas.UserOut)
 async def get_user_me(
         api_key: str = Header(None),  # noqa: B008
-        session: AsyncSession = Depends(get_db),
+        session: AsyncSession = Depends(get_db_read),
 ) -> schemas.UserOut:
     """
     Пользователь может получить информацию о своём профиле
@@ -35,8 +37,9 @@ async def get_user_me(
         данные пользователя и статус ответа
     """
     res: Union[
-        str, Tuple[models.User, Sequence[models.User], Sequence[models.User]]
+        str, Tuple[Row, Sequence[Row], Sequence[Row]]
     ] = await get_user_me_from_db(api_key, session)
+    await release_connection(session)
     if isinstance(res, str):
         err: List[str] = res.split("&")
         raise UnicornException(
@@ -64,46 +67,76 @@ async def get_user_me(
 
 @router.get("/{id}", status_code=200, response_model=schemas.UserOut)
 async def get_user_id_(
+        request: Request,
         id: Annotated[int, Path(gt=0, description="Get user by ID")],
+        if_none_match: Annotated[Optional[str], Header()] = None,
         session: AsyncSession = Depends(get_db)
-) -> schemas.UserOut:
+) -> Response:
     """
-    Обработка запроса на получение информацию о профиле пользователя по ID
+    Обработка запроса на получение информацию о профиле пользователя по ID.
+    Готовый ответ берется из кэша profile_cache, если клиент уже имеет
+    его текущую версию (If-None-Match) - возвращается 304 без тела.
+    Кэш сбрасывается при фиксации записей на основной БД, поэтому профиль
+    для него читается с нее, а не с реплики. Ответ из кэша отмечается в
+    request.state.cache_hit: он не входит в базовую задержку маршрута
+    (src/concurrency.py)
+    :param request: Request
+        запрос
     :param id: int
         ID пользователя
+    :param if_none_match: Optional[str]
+        ETag сохраненной клиентом версии профиля
     :param session: AsyncSession
         сеанс базы данных
-    :return: schemas.UserOut
+    :return: Response
         данные пользователя и статус ответа
     """
-    res: Union[
-        str, Tuple[models.User, Sequence[models.User], Sequence[models.User]]
-    ] = await get_user_id(session, id)
-    if isinstance(res, str):
-        err: List[str] = res.split("&")
-        raise UnicornException(
-            result=False,
-            error_type=err[0].strip(),
-            error_message=err[1].strip(),
+    cached: Optional[Tuple[bytes, str]] = profile_cache.get(id)
+    request.state.cache_hit = cached is not None
+    if cached is None:
+        generation: int = profile_cache.generation
+        res: Union[
+            str, Tuple[Row, Sequence[Row], Sequence[Row]]
+        ] = await get_user_id(session, id)
+        await release_connection(session)
+        if isinstance(res, str):
+            err: List[str] = res.split("&")
+            raise UnicornException(
+                result=False,
+                error_type=err[0].strip(),
+                error_message=err[1].strip(),
+            )
+
+        me_data, following, followers = res
+
+        user_followers: List[schemas.User] = [
+            schemas.User(id=i_user.id, name=i_user.name)
+            for i_user in followers
+        ]
+        user_following: List[schemas.User] = [
+            schemas.User(id=i_user.id, name=i_user.name)
+            for i_user in following
+        ]
+        user_me: schemas.UserAll = schemas.UserAll(
+            id=me_data.id,
+            name=me_data.name,
+            followers=user_followers,
+            following=user_following,
         )
-
-    me_data, following, followers = res
-
-    user_followers: List[schemas.User] = [
-        schemas.User(id=i_user.id, name=i_user.name) for i_user in followers
-    ]
-    user_following: List[schemas.User] = [
-        schemas.User(id=i_user.id, name=i_user.name) for i_user in following
-    ]
-    user_me: schemas.UserAll = schemas.UserAll(
-        id=me_data.id,
-        name=me_data.name,
-        followers=user_followers,
-        following=user_following,
+        body: bytes = schemas.UserOut(
+            rusult=True, user=user_me
+        ).model_dump_json().encode()
+        cached = (body, make_etag(body))
+        profile_cache.set(id, cached, generation)
+
+    body, etag = cached
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(
+        content=body, media_type="application/json", headers=headers
     )
 
-    return schemas.UserOut(rusult=True, user=user_me)
-
 
 @router.post(
     "/{id}/follow",
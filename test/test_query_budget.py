@@ -0,0 +1,138 @@
+"""
+Бюджет SQL-запросов на один вызов API.
+
+Лишние запросы появляются раньше, чем рост времени ответа, поэтому число
+запросов каждого обработчика ограничено и не должно зависеть от объема
+данных (числа твитов, лайков, подписок).
+"""
+from typing import Dict, List
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src import models
+
+# обработчик: допустимое число запросов
+# каждая запись добавляет одно событие в outbox, лайк и подписка -
+# еще и уведомление
+BUDGETS: Dict[str, int] = {
+    "GET /api/users/me": 2,
+    "GET /api/users/{id}": 2,
+    "GET /api/tweets": 3,
+    "POST /api/tweets": 3,
+    "DELETE /api/tweets/{id}": 6,
+    "POST /api/tweets/{id}/likes": 3,
+    "DELETE /api/tweets/{id}/likes": 2,
+    "POST /api/users/{id}/follow": 5,
+    "DELETE /api/users/{id}/follow": 4,
+}
+
+HEADERS = {"api-key": "test2"}
+HEADERS_OTHER = {"api-key": "test3"}
+
+
+async def add_tweets(
+        db_session: AsyncSession, count: int, media: int, likes: List[int]
+) -> None:
+    """Добавляет твиты с медиафайлами и лайками напрямую в БД"""
+    for _ in range(count):
+        medias = [
+            models.TweetMedia(name_file=f"budget_{i}.jpg")
+            for i in range(media)
+        ]
+        db_session.add_all(medias)
+        await db_session.flush()
+        tweet = models.Tweet(
+            tweet_data="budget",
+            tweet_media_ids=[i_media.media_id for i_media in medias],
+            user_id=1,
+        )
+        db_session.add(tweet)
+        await db_session.flush()
+        db_session.add_all(
+            [
+                models.LikesTweet(user_id=i_user, tweet_id=tweet.id)
+                for i_user in likes
+            ]
+        )
+    await db_session.commit()
+
+
+@pytest.mark.parametrize(
+    "endpoint, url",
+    [
+        ("GET /api/users/me", "/api/users/me"),
+        ("GET /api/users/{id}", "/api/users/1"),
+        ("GET /api/tweets", "/api/tweets"),
+    ],
+)
+async def test_read_budget(
+        client: AsyncClient, count_queries, endpoint: str, url: str
+):
+    with count_queries() as queries:
+        response = await client.get(url, headers=HEADERS)
+    assert response.status_code == 200
+    assert len(queries) <= BUDGETS[endpoint], queries
+
+
+async def test_feed_budget_does_not_grow(
+        client: AsyncClient, db_session: AsyncSession, count_queries
+):
+    await add_tweets(db_session, count=1, media=1, likes=[2])
+    with count_queries() as small:
+        response = await client.get("/api/tweets", headers=HEADERS)
+    assert response.status_code == 200
+
+    await add_tweets(db_session, count=20, media=3, likes=[2, 3, 4])
+    with count_queries() as large:
+        response = await client.get("/api/tweets", headers=HEADERS)
+    assert response.status_code == 200
+    assert len(response.json()["tweets"]) >= 21
+
+    assert len(large) <= BUDGETS["GET /api/tweets"], large
+    assert len(large) == len(small), large
+
+
+async def test_tweet_and_like_budget(client: AsyncClient, count_queries):
+    with count_queries() as queries:
+        response = await client.post(
+            "/api/tweets",
+            headers=HEADERS,
+            json={"tweet_data": "budget", "tweet_media_ids": []},
+        )
+    assert response.status_code == 201
+    assert len(queries) <= BUDGETS["POST /api/tweets"], queries
+    url: str = f"/api/tweets/{response.json()['tweet_id']}"
+
+    with count_queries() as queries:
+        response = await client.post(f"{url}/likes", headers=HEADERS_OTHER)
+    assert response.status_code == 201
+    assert len(queries) <= BUDGETS["POST /api/tweets/{id}/likes"], queries
+
+    with count_queries() as queries:
+        response = await client.delete(f"{url}/likes", headers=HEADERS_OTHER)
+    assert response.status_code == 200
+    assert len(queries) <= BUDGETS["DELETE /api/tweets/{id}/likes"], queries
+
+    await client.post(f"{url}/likes", headers=HEADERS_OTHER)
+    with count_queries() as queries:
+        response = await client.delete(url, headers=HEADERS)
+    assert response.status_code == 200
+    assert len(queries) <= BUDGETS["DELETE /api/tweets/{id}"], queries
+
+
+async def test_follow_budget(client: AsyncClient, count_queries):
+    with count_queries() as queries:
+        response = await client.post(
+            "/api/users/2/follow", headers=HEADERS_OTHER
+        )
+    assert response.status_code == 201
+    assert len(queries) <= BUDGETS["POST /api/users/{id}/follow"], queries
+
+    with count_queries() as queries:
+        response = await client.delete(
+            "/api/users/2/follow", headers=HEADERS_OTHER
+        )
+    assert response.status_code == 200
+    assert len(queries) <= BUDGETS["DELETE /api/users/{id}/follow"], queries
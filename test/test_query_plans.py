@@ -0,0 +1,70 @@
+import json
+from typing import Any, Dict, Iterator, List, Set
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src import queries
+
+# запрос, значения параметров, таблицы, которые допустимо читать целиком
+HOT_QUERIES = [
+    ("USER_BY_API_KEY", {"apy_key_user": "test"}, set()),
+    ("USER_ROW_BY_API_KEY", {"apy_key_user": "test"}, set()),
+    ("USER_ROW_BY_ID", {"id_user": 1}, set()),
+    ("USER_FOLLOW_ROWS", {"id_user": 1}, set()),
+    ("TWEET_OF_USER", {"id_user": 1, "id_tweet": 1}, set()),
+    ("LIKE_OF_USER", {"id_user": 1, "id_tweet": 1}, set()),
+    ("MEDIA_NAMES", {"id_medias": [1, 2]}, set()),
+    ("FEED_LIKES", {"id_tweets": [1, 2]}, set()),
+    # лента выводит все твиты, поэтому читает таблицу tweets целиком
+    ("FEED_TWEETS", {}, {"tweets"}),
+]
+
+
+def iter_plan_nodes(node: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield node
+    for i_child in node.get("Plans", []):
+        yield from iter_plan_nodes(i_child)
+
+
+@pytest.mark.parametrize("name, params, allowed", HOT_QUERIES)
+async def test_hot_query_uses_indexes(
+        event_loop,
+        db_session: AsyncSession,
+        name: str,
+        params: Dict[str, Any],
+        allowed: Set[str],
+):
+    stmt = getattr(queries, name)
+    if params:
+        stmt = stmt.params(**params)
+    sql: str = str(
+        stmt.compile(
+            dialect=postgresql.dialect(),
+            compile_kwargs={"literal_binds": True},
+        )
+    )
+
+    # на маленькой тестовой БД планировщик выберет Seq Scan и при наличии
+    # индекса, поэтому запрещаем его: Seq Scan останется только без индекса
+    await db_session.execute(text("SET LOCAL enable_seqscan = off"))
+    try:
+        query = await db_session.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))
+        explain: Any = query.scalar_one()
+    finally:
+        await db_session.execute(text("RESET enable_seqscan"))
+
+    if isinstance(explain, str):
+        # asyncpg отдает json без разбора
+        explain = json.loads(explain)
+    plan: Dict[str, Any] = explain[0]["Plan"]
+
+    seq_scans: List[str] = [
+        i_node["Relation Name"]
+        for i_node in iter_plan_nodes(plan)
+        if i_node["Node Type"] == "Seq Scan"
+        and i_node["Relation Name"] not in allowed
+    ]
+    assert not seq_scans, f"{name}: Seq Scan on {seq_scans}"